@@ -1,81 +1,252 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request
+from flask_sock import Sock
 import google.generativeai as genai
 import os
+import math
+import socket
+import sqlite3
+import threading
+import tempfile
 from dotenv import load_dotenv
 import random
-import time  # noqa F401
+import secrets
+import atexit
+import time
 from datetime import datetime
+from urllib.parse import urlencode
+
+from profile_store import ProfileStore
+from snapshot import Snapshotter
+from event_log import EventLog
+from rate_limit import RateLimiter
+from profiler import RequestProfiler
+from providers import LocalModel, ModelBusy, ModelRouter
+from write_behind import UserStore, WriteBehind
+from history import HistoryStore, history_key
+from shard_router import HashRing
+from structured_log import StructuredLog, parse_sample_rates
+from schema import (ChatReply, ChunkFrame, DecodeError, ErrorReply, chat_request_decoder,   # noqa: E501
+                    encoder, evict_request_decoder, reset_request_decoder)
 
 # -----------------------------
 # Load environment variables
 # -----------------------------
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not set in .env")
-
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel("gemini-2.0-flash")
+LOCAL_MODEL_PATH = os.getenv("LOCAL_MODEL_PATH", "")
+LOCAL_MODEL_TIERS = [t for t in os.getenv("LOCAL_MODEL_TIERS", "Basic").split(",") if t]   # noqa: E501
+if not GEMINI_API_KEY and not LOCAL_MODEL_PATH:
+    raise ValueError("GEMINI_API_KEY not set in .env (or set LOCAL_MODEL_PATH to run offline)")   # noqa: E501
+
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "state.snap")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "60"))
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", "")
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", os.path.join(tempfile.gettempdir(), "emotional_connect_ratelimit.db"))   # noqa: E501
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+MEMORY_DB = os.getenv("MEMORY_DB", "")
+HISTORY_DB = os.getenv("HISTORY_DB", "history.db")
+HISTORY_ORIGINS = [o for o in os.getenv("HISTORY_ORIGINS", "http://localhost:8501,http://127.0.0.1:8501").split(",") if o]   # noqa: E501
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATES = parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", "/health=0,*=1"))   # noqa: E501
+PORT = int(os.getenv("PORT", "9000"))
+DEBUG = os.getenv("DEBUG", "1") == "1"
+
+model = None
+if GEMINI_API_KEY:
+    genai.configure(api_key=GEMINI_API_KEY)
+    model = genai.GenerativeModel("gemini-2.0-flash")
+
+# With debug=True, `python app.py` first starts a reloader parent that only
+# watches files; the actual server is a child with WERKZEUG_RUN_MAIN set.
+RELOADER_PARENT = DEBUG and __name__ == "__main__" and os.environ.get("WERKZEUG_RUN_MAIN") != "true"   # noqa: E501
+
+# Basic tier and upstream outages are served by the local model, if any. The
+# reloader parent never serves, so it doesn't hold a copy in RAM.
+local_model = LocalModel(LOCAL_MODEL_PATH) if LOCAL_MODEL_PATH and not RELOADER_PARENT else None   # noqa: E501
+router = ModelRouter(model, local_model, local_tiers=LOCAL_MODEL_TIERS)
 
 # -----------------------------
 # Flask App
 # -----------------------------
 app = Flask(__name__)
+sock = Sock(app)
+
+# Shared by every worker process on this host; empty RATE_LIMIT_DB disables it   # noqa: E501
+rate_limiter = RateLimiter(RATE_LIMIT_DB) if RATE_LIMIT_DB else None
+
+# Off unless PROFILE_TOKEN is set; see /debug/profile
+profiler = RequestProfiler(PROFILE_TOKEN, PROFILE_SAMPLE_RATE)
+
+# JSON lines to LOG_FILE (or stderr), written off the request thread
+log = StructuredLog(LOG_FILE, LOG_SAMPLE_RATES, LOG_LEVEL)
+atexit.register(log.close)
+
+
+@app.before_request
+def begin_request():
+    g.started = time.perf_counter()
+    log.begin(request.path, request.headers.get("X-Request-Id"))
+
+
+@app.after_request
+def end_request(response):
+    log.info("request", method=request.method, status=response.status_code,
+             ms=round((time.perf_counter() - g.started) * 1000, 3))
+    response.headers["X-Request-Id"] = log.request_id
+    return response
 
 # -----------------------------
 # Memory: Enhanced chat history
 # -----------------------------
 user_memories = {}
-user_profiles = {}
+user_profiles = ProfileStore()
+snapshotter = Snapshotter(SNAPSHOT_PATH, user_memories, user_profiles, SNAPSHOT_INTERVAL)   # noqa: E501
+
+
+def flush_users(user_ids):
+    """Write the current view of each user to the durable store."""
+    user_store.write_many([(user_id, user_memories.get(user_id), user_profiles.peek(user_id))   # noqa: E501
+                           for user_id in user_ids])
+
+
+# The dicts above are the in-memory view; with MEMORY_DB set, changes are
+# flushed to SQLite off the request path.
+user_store = UserStore(MEMORY_DB) if MEMORY_DB else None
+write_behind = WriteBehind(flush_users) if user_store else None
+if write_behind:
+    atexit.register(write_behind.close)
+
+
+# Every message sent with a history_token, for GET /history and the export;
+# empty HISTORY_DB disables it
+history = HistoryStore(HISTORY_DB) if HISTORY_DB else None
+if history:
+    atexit.register(history.close)
+
+# One-time export links: ticket -> (history key, user_id, expiry)
+EXPORT_TICKET_SECONDS = 60
+export_tickets = {}
+
+
+def load_user(user_id):
+    """Read a user through from the durable store on a view miss."""
+    if user_store is None or user_id in user_memories or write_behind.pending(user_id):   # noqa: E501
+        return
+    stored = user_store.load(user_id)
+    if stored is not None:
+        memory, profile = stored
+        if memory is not None:
+            user_memories[user_id] = memory
+        if profile is not None:
+            user_profiles.put(user_id, profile)
+
+
+def mark_dirty(user_id):
+    if write_behind:
+        write_behind.mark(user_id)
+
+
+# The shard list last sent by the router (POST /evict) and this shard's URL
+# on it; None for a backend that isn't behind the router. Views only change
+# under owner_lock, after owns() has said the user is still ours.
+shard_owner = None
+owner_lock = threading.Lock()
+
+
+def owns(user_id):
+    if shard_owner is None:
+        return True
+    ring, url = shard_owner
+    return bool(ring.shards) and ring.get(user_id) == url
+
+
+def moved_reply():
+    return ErrorReply("User moved to another shard, try again", retry_after=1.0), 409   # noqa: E501
+
+
+def evict_users(user_ids):
+    """Write users' pending changes, then drop them from the view.
+
+    Their next request, here or on another shard, reads them back from the
+    store, so a view left behind never shadows newer rows.
+    """
+    pending = write_behind.forget(user_ids)
+    try:
+        flush_users(pending)
+    except Exception:
+        for user_id in pending:
+            write_behind.mark(user_id)
+        raise
+    for user_id in user_ids:
+        user_memories.pop(user_id, None)
+        user_profiles.remove(user_id)
+
+# -----------------------------
+# Request event log (opt-in)
+# -----------------------------
+event_log = EventLog(EVENT_LOG_DIR) if EVENT_LOG_DIR else None
+if event_log:
+    atexit.register(event_log.close)
+
+
+def log_event(params, arrived, prompt, marks, reply=None, error=None):
+    """Queue one request's shape and stage timings for the event log."""
+    if event_log is None:
+        return
+    stages = ("memory", "prompt", "model", "finish")
+    event_log.write({
+        "ts": arrived,
+        **params,
+        "prompt_chars": len(prompt),
+        "reply_chars": len(reply) if reply is not None else None,
+        "error": error,
+        "timings_ms": {
+            stage: round((end - start) * 1000, 3)
+            for stage, start, end in zip(stages, marks, marks[1:])
+        }
+    })
 
 
 def update_memory(user_id, user_msg, ai_msg=None, max_pairs=6):
     """Store last N chat pairs for a user with timestamps."""
-    if user_id not in user_memories:
-        user_memories[user_id] = []
-
     timestamp = datetime.now().strftime("%H:%M")
-    user_memories[user_id].append(("You", user_msg, timestamp))
+    entries = [("You", user_msg, timestamp)]
 
     if ai_msg:
-        user_memories[user_id].append(("AI", ai_msg, timestamp))
+        entries.append(("AI", ai_msg, timestamp))
+
+    # Keep only last max_pairs * 2 entries. The list is replaced rather than
+    # mutated so snapshots can share it without locking.
+    user_memories[user_id] = (user_memories.get(user_id, []) + entries)[-max_pairs * 2:]   # noqa: E501
+    mark_dirty(user_id)
+
+    return format_memory(user_memories[user_id])
 
-    # Keep only last max_pairs * 2 entries
-    user_memories[user_id] = user_memories[user_id][-max_pairs * 2:]
 
-    # Format for context
-    return "\n".join([f"{sender} ({ts}): {msg}" for sender, msg, ts in user_memories[user_id]])  # noqa: E501
+def format_memory(entries):
+    """Format chat entries for the prompt context."""
+    return "\n".join([f"{sender} ({ts}): {msg}" for sender, msg, ts in entries])  # noqa: E501
 
 
 def get_user_profile(user_id):
     """Get user conversation patterns and preferences."""
-    if user_id not in user_profiles:
-        user_profiles[user_id] = {
-            "conversation_count": 0,
-            "preferred_topics": [],
-            "communication_style": "balanced",
-            "emotional_state_history": [],
-            "last_active": datetime.now()
-        }
-    return user_profiles[user_id]
+    return user_profiles.get(user_id)
 
 
-def update_user_profile(user_id, user_msg, ai_behavior):
+def update_user_profile(user_id, user_msg, ai_behavior, relationship_type=None):    # noqa: E501
     """Update user profile based on interactions."""
-    profile = get_user_profile(user_id)
-    profile["conversation_count"] += 1
-    profile["last_active"] = datetime.now()
-
     # Simple emotion detection from user message
     if any(word in user_msg.lower() for word in ["sad", "upset", "tired", "stressed"]):    # noqa: E501
-        profile["emotional_state_history"].append("negative")
+        emotion = "negative"
     elif any(word in user_msg.lower() for word in ["happy", "excited", "great", "awesome"]):    # noqa: E501
-        profile["emotional_state_history"].append("positive")
+        emotion = "positive"
     else:
-        profile["emotional_state_history"].append("neutral")
+        emotion = "neutral"
 
-    # Keep only last 10 emotional states
-    profile["emotional_state_history"] = profile["emotional_state_history"][-10:]    # noqa: E501
+    user_profiles.record(user_id, emotion, relationship_type)
+    mark_dirty(user_id)
 
 
 # -----------------------------
@@ -249,7 +420,6 @@ def build_prompt(user_input, relationship_type, tier, user_id, region, tz, memor
                  user_gender="male", ai_gender="female", language="English", ai_behavior="caring"):    # noqa: E501
 
     user_profile = get_user_profile(user_id)
-    update_user_profile(user_id, user_input, ai_behavior)
 
     persona_text = get_relationship_system_prompt({
         "type": relationship_type,
@@ -329,80 +499,387 @@ Respond as a real human would - naturally, emotionally, imperfectly. Make it fee
 # -----------------------------
 # API Endpoint with typing simulation
 # -----------------------------
-@app.route('/process', methods=['POST'])
-def process():
-    data = request.json
-    user_input = data.get('user_input', '').strip()
+def json_response(body, status=200, headers=None):
+    """Encode body (a dict or schema Struct) with msgspec."""
+    return Response(encoder.encode(body), status, headers, mimetype="application/json")   # noqa: E501
+
+
+REQUEST_FIELDS = ("user_input", "relationship_type", "tier", "user_id", "region", "tz",   # noqa: E501
+                  "user_gender", "ai_gender", "language", "ai_behavior")
+
+
+def handle_message(req, on_chunk=None):
+    """Run one chat turn for a validated ChatRequest; return (body, status).
+
+    When on_chunk is given the model is called in streaming mode and each
+    piece of reply text is passed to it as it arrives.
+    """
+    user_input = req.user_input.strip()
 
     if not user_input:
-        return jsonify({"error": "Empty message"}), 400
+        return ErrorReply("Empty message"), 400
 
     # Extract parameters
-    relationship_type = data.get('relationship_type', 'friend')
-    tier = data.get('tier', 'Basic')
-    user_id = data.get('user_id', 'user_001')
-    region = data.get('region', 'Maharashtra')
-    tz = data.get('tz', 'Asia/Kolkata')
-    user_gender = data.get('user_gender', 'male')
-    ai_gender = data.get('ai_gender', 'female')
-    language = data.get('language', 'English')
-    ai_behavior = data.get('ai_behavior', 'caring')
-
-    # Update memory and build prompt
-    memory_context = update_memory(user_id, user_input)
+    relationship_type = req.relationship_type
+    tier = req.tier
+    user_id = req.user_id
+    region = req.region
+    tz = req.tz
+    user_gender = req.user_gender
+    ai_gender = req.ai_gender
+    language = req.language
+    ai_behavior = req.ai_behavior
+
+    if rate_limiter:
+        try:
+            retry_after = rate_limiter.acquire(user_id, tier)
+        except sqlite3.Error as e:
+            # Fail open: a locked or broken limiter database must not stall
+            # or fail the chat itself
+            log.warning("rate_limit_error", user_id=user_id, tier=tier, error=str(e))   # noqa: E501
+            retry_after = 0
+        if retry_after:
+            # A warning, so sampling never hides who is being limited
+            log.warning("rate_limited", user_id=user_id, tier=tier, retry_after=retry_after)   # noqa: E501
+            return ErrorReply("Rate limit exceeded", retry_after=retry_after), 429   # noqa: E501
+
+    if not owns(user_id):
+        return moved_reply()
+
+    params = {field: getattr(req, field) for field in REQUEST_FIELDS}
+    params["user_input"] = user_input
+    marks = [time.perf_counter()]
+    # Arrival time, which replay paces by; the finish time would shift each
+    # request by its own latency
+    arrived = time.time()
+
+    # Read memory (the message is only stored once the reply is in), update
+    # the profile and build the prompt
+    load_user(user_id)
+    timestamp = datetime.now().strftime("%H:%M")
+    memory_context = format_memory(user_memories.get(user_id, []) + [("You", user_input, timestamp)])   # noqa: E501
+    with owner_lock:
+        if not owns(user_id):
+            return moved_reply()
+        update_user_profile(user_id, user_input, ai_behavior, relationship_type)   # noqa: E501
+    marks.append(time.perf_counter())
+    log.info("memory_read", user_id=user_id, ms=round((marks[1] - marks[0]) * 1000, 3))   # noqa: E501
     prompt = build_prompt(user_input, relationship_type, tier, user_id, region, tz,   # noqa: E501
                           memory_context, user_gender, ai_gender, language, ai_behavior)   # noqa: E501
+    marks.append(time.perf_counter())
 
     try:
         # Simulate typing delay based on response complexity
         typing_delay = random.uniform(1.5, 3.5)
 
-        response = model.generate_content(prompt)
-        reply = response.text.strip()
+        if on_chunk is None:
+            reply = router.generate_content(prompt, tier).text
+        else:
+            parts = []
+            for chunk in router.generate_content(prompt, tier, stream=True):
+                parts.append(chunk.text)
+                on_chunk(chunk.text)
+            reply = "".join(parts)
+        marks.append(time.perf_counter())
+        log.info("model_call", user_id=user_id, tier=tier, stream=on_chunk is not None,   # noqa: E501
+                 prompt_chars=len(prompt), reply_chars=len(reply), ms=round((marks[3] - marks[2]) * 1000, 3))   # noqa: E501
 
         # Clean up response
-        reply = reply.replace("AI:", "").replace("Assistant:", "").strip()
+        reply = reply.strip().replace("AI:", "").replace("Assistant:", "").strip()   # noqa: E501
+
+        # Add to memory and the full history. If the router moved the user
+        # during the model call, the new owner's rows must not be overwritten
+        with owner_lock:
+            if not owns(user_id):
+                log.warning("user_moved", user_id=user_id)
+                return moved_reply()
+            update_memory(user_id, user_input, ai_msg=reply)
+        seq = None
+        if history and req.history_token:
+            seq = history.append(history_key(user_id, req.history_token),
+                                 [("You", user_input, timestamp), ("AI", reply, timestamp)])   # noqa: E501
+
+        result = ChatReply(
+            reply=reply,
+            typing_delay=typing_delay,
+            conversation_count=get_user_profile(user_id)["conversation_count"],  # noqa: E501
+            seq=seq
+        )
+        marks.append(time.perf_counter())
+        log.info("memory_write", user_id=user_id, seq=seq, ms=round((marks[4] - marks[3]) * 1000, 3))   # noqa: E501
+        log_event(params, arrived, prompt, marks, reply=reply)
+        return result, 200
+
+    except ModelBusy as e:
+        # The local model's backlog is full: shed load instead of queueing
+        marks.append(time.perf_counter())
+        log.warning("model_busy", user_id=user_id, tier=tier, error=str(e))
+        log_event(params, arrived, prompt, marks, error=str(e))
+        return ErrorReply(str(e), retry_after=5.0), 503
 
-        # Add to memory
-        update_memory(user_id, user_input, ai_msg=reply)
+    except Exception as e:
+        marks.append(time.perf_counter())
+        log.error("model_error", user_id=user_id, tier=tier, error=str(e))
+        log_event(params, arrived, prompt, marks, error=str(e))
+        return ErrorReply(f"AI Error: {str(e)}"), 500
 
-        return jsonify({
-            "reply": reply,
-            "typing_delay": typing_delay,
-            "conversation_count": get_user_profile(user_id)["conversation_count"]  # noqa: E501
-        })
 
-    except Exception as e:
-        return jsonify({"error": f"AI Error: {str(e)}"}), 500
+@app.route('/process', methods=['POST'])
+def process():
+    with profiler.sampled(request.headers.get("X-Profile-Token")):
+        try:
+            req = chat_request_decoder.decode(request.get_data())
+        except DecodeError as e:
+            return json_response(ErrorReply(f"Invalid request: {e}"), 400)
+
+        body, status = handle_message(req)
+    headers = {}
+    if status in (409, 429, 503):
+        headers["Retry-After"] = str(math.ceil(body.retry_after))
+    return json_response(body, status, headers)
+
+
+def send_frame(ws, frame):
+    """Send a schema Struct as a text frame (bytes would go out as binary)."""   # noqa: E501
+    ws.send(encoder.encode(frame).decode())
+
+
+@sock.route('/chat')
+def chat(ws):
+    """Long-lived chat channel: JSON messages in, streamed reply chunks out."""   # noqa: E501
+    # Chunks are small; don't let Nagle hold them back waiting for ACKs
+    ws.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    while True:
+        raw = ws.receive()
+        # Each message is its own request for logging
+        with log.request("/chat"):
+            started = time.perf_counter()
+            try:
+                req = chat_request_decoder.decode(raw)
+            except DecodeError as e:
+                log.info("message", status=400)
+                send_frame(ws, ErrorReply(f"Invalid request: {e}", type="error"))   # noqa: E501
+                continue
+
+            with profiler.sampled():
+                body, status = handle_message(req, on_chunk=lambda text: send_frame(   # noqa: E501
+                    ws, ChunkFrame(req.id, text)))
+            body.type = "done" if status == 200 else "error"
+            body.id = req.id
+            send_frame(ws, body)
+            log.info("message", status=status, ms=round((time.perf_counter() - started) * 1000, 3))   # noqa: E501
 
 
 @app.route('/reset_memory', methods=['POST'])
 def reset_memory():
     """Reset conversation memory for a user."""
-    data = request.json
-    user_id = data.get('user_id', 'user_001')
+    try:
+        req = reset_request_decoder.decode(request.get_data())
+    except DecodeError as e:
+        return json_response(ErrorReply(f"Invalid request: {e}"), 400)
+    user_id = req.user_id
+
+    with owner_lock:
+        if not owns(user_id):
+            body, status = moved_reply()
+            return json_response(body, status, {"Retry-After": "1"})
+        if user_id in user_memories:
+            del user_memories[user_id]
+        user_profiles.remove(user_id)
+        mark_dirty(user_id)
+    if history and req.history_token:
+        history.delete(history_key(user_id, req.history_token))
+    return json_response({"message": "Memory reset successfully"})
+
+
+@app.route('/evict', methods=['POST'])
+def evict():
+    """Take the router's next shard list, then drop the users it moves away.
+
+    The router calls this before it switches, so from here on requests for
+    those users get 409 and their pending changes are in the store before
+    the new owner is sent anything. Eviction needs MEMORY_DB: without a
+    shared store the view is the only copy.
+    """
+    global shard_owner
+    try:
+        req = evict_request_decoder.decode(request.get_data())
+    except DecodeError as e:
+        return json_response(ErrorReply(f"Invalid request: {e}"), 400)
+
+    ring = HashRing(req.shards)
+    with owner_lock:
+        shard_owner = (ring, req.url)
+    if user_store is None:
+        return json_response({"evicted": 0})
+
+    known = set(user_memories) | set(user_profiles.ids())
+    moved = [user_id for user_id in known if ring.get(user_id) != req.url] if req.shards else list(known)   # noqa: E501
+    evict_users(moved)
+    return json_response({"evicted": len(moved)})
+
+
+def history_origin():
+    """CORS headers for the chat component, which pages history itself."""
+    origin = request.headers.get("Origin")
+    if origin not in HISTORY_ORIGINS:
+        return {}
+    return {"Access-Control-Allow-Origin": origin,
+            "Access-Control-Allow-Headers": "X-History-Token",
+            "Vary": "Origin"}
+
+
+def history_user():
+    """The history key for ?user_id= and the X-History-Token header.
+
+    The token is never accepted in the URL, where access logs, proxies and
+    browser history would keep it.
+    """
+    if history is None:
+        return None, json_response(ErrorReply("History is disabled"), 404)
+    user_id = request.args.get("user_id", "")
+    token = request.headers.get("X-History-Token", "")
+    if not 1 <= len(user_id) <= 64:
+        return None, json_response(ErrorReply("user_id is required"), 400)
+    if not 16 <= len(token) <= 64:
+        return None, json_response(ErrorReply("A history token is required"), 401)   # noqa: E501
+    return history_key(user_id, token), None
+
+
+@app.route('/history', methods=['GET', 'OPTIONS'])
+def get_history():
+    """One page of a user's messages, oldest first.
+
+    ?before=<seq> pages backwards; the response's next_before is the cursor
+    for the next older page (null when there is none). Only messages sent
+    with the same history_token are returned.
+    """
+    headers = history_origin()
+    if request.method == 'OPTIONS':
+        # CORS preflight for the X-History-Token header
+        return Response(status=204, headers=headers)
+    key, error = history_user()
+    if error:
+        error.headers.update(headers)
+        return error
+    before = request.args.get("before", type=int)
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+    messages, next_before = history.page(key, before, limit)
+    return json_response({"messages": messages, "next_before": next_before},
+                         headers=headers)
+
+
+@app.route('/history/export', methods=['POST'])
+def export_ticket():
+    """Issue a one-time link for GET /history/export.
+
+    A browser download can't send the token header, so the frontend trades
+    the token for a ticket that works once, for EXPORT_TICKET_SECONDS.
+    """
+    key, error = history_user()
+    if error:
+        return error
+    now = time.monotonic()
+    for ticket, (_, _, expires) in list(export_tickets.items()):
+        if expires < now:
+            export_tickets.pop(ticket, None)
+    ticket = secrets.token_urlsafe(16)
+    user_id = request.args["user_id"]
+    export_tickets[ticket] = (key, user_id, now + EXPORT_TICKET_SECONDS)
+    return json_response({
+        "url": f"/history/export?{urlencode({'user_id': user_id, 'ticket': ticket})}",   # noqa: E501
+        "expires_in": EXPORT_TICKET_SECONDS
+    })
 
-    if user_id in user_memories:
-        del user_memories[user_id]
-    if user_id in user_profiles:
-        del user_profiles[user_id]
-    return jsonify({"message": "Memory reset successfully"})
+
+@app.route('/history/export', methods=['GET'])
+def export_history():
+    """A user's whole chat as a text download, streamed from storage."""
+    if history is None:
+        return json_response(ErrorReply("History is disabled"), 404)
+    key, user_id, expires = export_tickets.pop(request.args.get("ticket", ""), (None, None, 0))   # noqa: E501
+    if expires < time.monotonic() or user_id != request.args.get("user_id"):
+        return json_response(ErrorReply("Export link is invalid or expired"), 403)   # noqa: E501
+    lines = (f"{sender} ({ts}): {text}\n\n" for _, sender, text, ts in history.iter_all(key))   # noqa: E501
+    filename = f"chat_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+    return Response(lines, mimetype="text/plain", headers={
+        "Content-Disposition": f"attachment; filename={filename}"
+    })
 
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
-    return jsonify({
+    return json_response({
         "status": "healthy",
         "active_users": len(user_memories),
+        "snapshot": snapshotter.stats,
+        "event_log": event_log.stats if event_log else None,
+        "models": router.stats,
+        "write_behind": write_behind.stats if write_behind else None,
+        "history": history.writer.stats if history else None,
+        "log": log.stats,
         "timestamp": datetime.now().isoformat()
     })
 
 
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Aggregate profile analytics across all users."""
+    minutes = request.args.get('minutes', 15, type=int)
+    return json_response({
+        "users": len(user_profiles),
+        "active_users": user_profiles.count_active_since(minutes),
+        "emotion_distribution": user_profiles.emotion_distribution()
+    })
+
+
+@app.route('/debug/profile', methods=['GET', 'POST'])
+def debug_profile():
+    """Collapsed stacks of profiled requests, for flamegraph.pl/speedscope.
+
+    Needs the X-Profile-Token header. POST {"sample_rate": 0.05} changes the
+    sampled fraction of requests; ?reset=1 clears collected samples.
+    """
+    if not profiler.authorized(request.headers.get("X-Profile-Token")):
+        return json_response({"error": "Not found"}, 404)
+
+    if request.method == 'POST':
+        sample_rate = (request.get_json(silent=True) or {}).get("sample_rate")   # noqa: E501
+        if not isinstance(sample_rate, (int, float)) or not 0 <= sample_rate <= 1:   # noqa: E501
+            return json_response({"error": "sample_rate must be between 0 and 1"}, 400)   # noqa: E501
+        profiler.sample_rate = sample_rate
+        return json_response({"sample_rate": profiler.sample_rate})
+
+    output = profiler.collapsed()
+    if request.args.get("reset"):
+        profiler.reset()
+    return Response(output, mimetype="text/plain")
+
+
+# -----------------------------
+# Warm restart
+# -----------------------------
+def start_snapshots():
+    """Restore the last snapshot and keep writing new ones in the background."""   # noqa: E501
+    if not SNAPSHOT_PATH:
+        return
+    if snapshotter.restore():
+        print(f"♻️ Restored {snapshotter.stats['restored_users']} users in "
+              f"{snapshotter.stats['restore_seconds']}s from {SNAPSHOT_PATH}")   # noqa: E501
+    elif "restore_error" in snapshotter.stats:
+        print(f"⚠️ Starting empty, could not restore {SNAPSHOT_PATH}: "
+              f"{snapshotter.stats['restore_error']}")
+    snapshotter.start()
+    atexit.register(snapshotter.stop)
+
+
 # -----------------------------
 # Run server
 # -----------------------------
 if __name__ == "__main__":
+    if not RELOADER_PARENT:
+        start_snapshots()
     print("🤖 Emotional Connect AI Backend Starting...")
-    print("🔗 API will be available at: http://localhost:9000")
-    app.run(host="0.0.0.0", port=9000, debug=True)
+    print(f"🔗 API will be available at: http://localhost:{PORT}")
+    app.run(host="0.0.0.0", port=PORT, debug=DEBUG)
@@ -0,0 +1,545 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from profile_store import EMOTIONS, RELATIONSHIP_TYPES, ProfileStore
+from profiler import RequestProfiler
+from rate_limit import RateLimiter
+from schema import ChatReply, chat_request_decoder, encoder
+from snapshot import Snapshotter
+from structured_log import JsonFormatter, StructuredLog
+from write_behind import UserStore, WriteBehind
+
+
+# -----------------------------
+# Helpers
+# -----------------------------
+def timed(label, fn, *args, **kwargs):
+    """Run fn once and print how long it took."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    print(f"{label}: {(time.perf_counter() - start) * 1000:.2f} ms")
+    return result
+
+
+# -----------------------------
+# Benchmarks
+# -----------------------------
+def bench_profiles(args):
+    """Bytes per user and query time of the columnar profile store."""
+    import tracemalloc
+
+    users = args.users
+    now = int(time.time())
+
+    def populate():
+        rng = random.Random(0)
+        store = ProfileStore(capacity=users)
+        for i in range(users):
+            store.record(f"user_{i}", rng.choice(EMOTIONS),
+                         rng.choice(RELATIONSHIP_TYPES), now - rng.randrange(7200))   # noqa: E501
+        return store
+
+    # Footprint pass: everything the store keeps alive, including the id
+    # dict, the names list and the id strings themselves
+    tracemalloc.start()
+    store = populate()
+    footprint = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del store
+
+    start = time.perf_counter()
+    store = populate()
+    print(f"load {users} users: {time.perf_counter() - start:.2f} s")
+
+    print(f"array bytes/user: {store.nbytes / users:.1f}")
+    print(f"total bytes/user (tracemalloc): {footprint / users:.1f}")
+    timed("count active last 15 min", store.count_active_since, 15, now)
+    timed("ids active last 15 min", store.active_since, 15, now)
+    timed("emotion distribution", store.emotion_distribution)
+
+
+def bench_snapshot(args):
+    """Snapshot duration, size and restore time for a populated backend."""
+    users = args.users
+    store = ProfileStore(capacity=users)
+    memories = {}
+    for i in range(users):
+        user_id = f"user_{i}"
+        store.record(user_id, EMOTIONS[i % 3], RELATIONSHIP_TYPES[i % 6])
+        memories[user_id] = [("You", f"message number {j} from {user_id}", "12:00")   # noqa: E501
+                             for j in range(12)]
+
+    # Stands in for a request thread: the longest gap between its 1 ms ticks
+    # is how long a request could be frozen by the snapshot
+    stalls = []
+    done = threading.Event()
+
+    def ticker():
+        last = time.perf_counter()
+        while not done.is_set():
+            time.sleep(0.001)
+            now = time.perf_counter()
+            stalls.append(now - last)
+            last = now
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "state.snap")
+        thread = threading.Thread(target=ticker)
+        thread.start()
+        timed("snapshot", Snapshotter(path, memories, store).snapshot)
+        done.set()
+        thread.join()
+        print(f"request-path stall: max {max(stalls) * 1000:.1f} ms, "
+              f"p99 {sorted(stalls)[int(len(stalls) * 0.99)] * 1000:.1f} ms")   # noqa: E501
+        print(f"snapshot size: {os.path.getsize(path) / 2**20:.1f} MiB")
+        restored = Snapshotter(path, {}, ProfileStore())
+        timed("restore", restored.restore)
+        assert len(restored.memories) == users
+
+        # An idle server's final snapshot, and one with profiles but no
+        # memories (every model call failed), must restore too
+        profiles_only = ProfileStore()
+        profiles_only.record("user_0", EMOTIONS[0], RELATIONSHIP_TYPES[0])
+        for profiles in (profiles_only, ProfileStore()):
+            Snapshotter(path, {}, profiles).snapshot()
+            restored = Snapshotter(path, {}, ProfileStore())
+            assert restored.restore(), restored.stats
+            assert restored.memories == {}
+            assert len(restored.profiles) == len(profiles)
+        print("empty round trips: ok")
+
+
+def serve(port, model_latency):
+    """Run the backend against the fake model (in a child process)."""
+    import replay
+    replay.app.router.remote = replay.FakeModel(latency=model_latency)
+    replay.app.app.run(host="127.0.0.1", port=port, threaded=True)
+
+
+def cpu_seconds(pid):
+    """User + system CPU time of a process, read from /proc (Linux only)."""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def bench_channel(args):
+    """Server CPU per message and latency: HTTP POST vs one WebSocket."""
+    from simple_websocket import Client
+
+    port = 9100
+    server = multiprocessing.Process(target=serve, args=(port, args.model_latency), daemon=True)   # noqa: E501
+    server.start()
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health")
+            break
+        except OSError:
+            time.sleep(0.1)
+
+    payload = {"user_id": "bench", "tier": "Pro", "user_input": "hello there"}
+
+    def post():
+        # What the Streamlit frontend did: a fresh connection per message
+        req = urllib.request.Request(
+            f"http://127.0.0.1:{port}/process", data=json.dumps(payload).encode(),   # noqa: E501
+            headers={"Content-Type": "application/json"})
+        json.load(urllib.request.urlopen(req))
+
+    ws = Client.connect(f"ws://127.0.0.1:{port}/chat")
+    # Browsers disable Nagle on WebSockets too
+    ws.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def stream():
+        ws.send(json.dumps(payload))
+        while json.loads(ws.receive())["type"] == "chunk":
+            pass
+
+    try:
+        for label, send in (("http post", post), ("websocket", stream)):
+            latencies = []
+            cpu = cpu_seconds(server.pid)
+            for _ in range(args.messages):
+                start = time.perf_counter()
+                send()
+                latencies.append(time.perf_counter() - start)
+            cpu = cpu_seconds(server.pid) - cpu
+            print(f"{label}: server cpu/msg {cpu / args.messages * 1000:.3f} ms, "   # noqa: E501
+                  f"latency p50 {statistics.median(latencies) * 1000:.2f} ms, "
+                  f"p99 {statistics.quantiles(latencies, n=100)[98] * 1000:.2f} ms")   # noqa: E501
+    finally:
+        ws.close()
+        server.terminate()
+
+
+def limiter_worker(path, decisions, users, results):
+    limiter = RateLimiter(path)
+    rng = random.Random()
+    failed = 0
+    start = time.perf_counter()
+    for _ in range(decisions):
+        try:
+            limiter.acquire(f"user_{rng.randrange(users)}", rng.choice(("Basic", "Lite", "Pro")))   # noqa: E501
+        except sqlite3.OperationalError:
+            # The app lets these requests through (fails open)
+            failed += 1
+    results.put((time.perf_counter() - start, failed))
+
+
+def bench_ratelimit(args):
+    """Limiter decisions per second for one and several worker processes."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ratelimit.db")
+        RateLimiter(path)
+        for workers in (1, args.workers):
+            results = multiprocessing.Queue()
+            procs = [multiprocessing.Process(target=limiter_worker, args=(path, args.messages, args.users, results))   # noqa: E501
+                     for _ in range(workers)]
+            start = time.perf_counter()
+            for proc in procs:
+                proc.start()
+            outcomes = [results.get() for _ in procs]
+            for proc in procs:
+                proc.join()
+            elapsed = time.perf_counter() - start
+            print(f"{workers} process(es): {workers * args.messages / elapsed:.0f} decisions/s, "   # noqa: E501
+                  f"{statistics.mean(t for t, _ in outcomes) / args.messages * 1e6:.1f} us/decision, "   # noqa: E501
+                  f"{sum(f for _, f in outcomes)} failed open")
+
+
+def bench_schema(args):
+    """Parse + validate + encode cost per request: stdlib json vs msgspec."""
+    body = json.dumps({
+        "user_input": "I had such a long day at work, feeling tired", "relationship_type": "mother",   # noqa: E501
+        "tier": "Pro", "user_id": "user_4821", "region": "Maharashtra", "tz": "Asia/Kolkata",   # noqa: E501
+        "user_gender": "male", "ai_gender": "female", "language": "English", "ai_behavior": "caring"   # noqa: E501
+    }).encode()
+    reply = "Arre beta, so tired? Did you eat anything? " * 5
+
+    def stdlib():
+        data = json.loads(body)
+        fields = [data.get(key, "") for key in ("user_input", "relationship_type", "tier", "user_id", "region",   # noqa: E501
+                                                "tz", "user_gender", "ai_gender", "language", "ai_behavior")]   # noqa: E501
+        assert fields[0]
+        return json.dumps({"reply": reply, "typing_delay": 2.5, "conversation_count": 7}).encode()   # noqa: E501
+
+    def compiled():
+        req = chat_request_decoder.decode(body)
+        assert req.user_input
+        return encoder.encode(ChatReply(reply=reply, typing_delay=2.5, conversation_count=7))   # noqa: E501
+
+    for label, fn in (("stdlib json, no validation", stdlib), ("msgspec schema", compiled)):   # noqa: E501
+        start = time.perf_counter()
+        for _ in range(args.messages):
+            fn()
+        per_request = (time.perf_counter() - start) / args.messages
+        print(f"{label}: {per_request * 1e6:.2f} us/request, "
+              f"{1 / per_request:,.0f} requests/s per core")
+
+
+def bench_profiler(args):
+    """Per-request cost of the profiling hook when off, idle and sampling."""
+    cases = (("disabled", RequestProfiler()),
+             ("enabled, rate 0", RequestProfiler("token")),
+             ("enabled, rate 1", RequestProfiler("token", sample_rate=1.0)))
+    for label, profiler in cases:
+        start = time.perf_counter()
+        for _ in range(args.messages):
+            with profiler.sampled(None):
+                pass
+        per_request = (time.perf_counter() - start) / args.messages
+        print(f"{label}: {per_request * 1e9:.0f} ns/request")
+
+
+def rss_mib():
+    """Resident set size of this process, from /proc (Linux only)."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+
+
+def bench_local(args):
+    """Load time, memory footprint and tokens/sec of the local CPU model."""
+    from providers import LocalModel
+
+    if not args.model_path:
+        raise SystemExit("--model-path to a GGUF model is required")
+    before = rss_mib()
+    model = timed("load", LocalModel, args.model_path)
+    print(f"model RSS: {rss_mib() - before:.0f} MiB")
+
+    prompt = ("You are a caring friend. Reply in 1-2 lines.\n"
+              'User just said: "I had such a long day at work"')
+    tokens = 0
+    start = time.perf_counter()
+    for _ in range(args.messages):
+        reply = model.generate_content(prompt).text
+        tokens += len(model.llm.tokenize(reply.encode(), add_bos=False))
+    elapsed = time.perf_counter() - start
+    print(f"{args.messages} replies: {tokens / elapsed:.1f} tokens/s, "
+          f"{elapsed / args.messages * 1000:.0f} ms/reply")
+
+
+def bench_writebehind(args):
+    """Request-path latency of inline SQLite writes vs write-behind."""
+    users = min(args.users, args.messages)
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, behind in (("inline", False), ("write-behind", True)):
+            store = UserStore(os.path.join(tmp, f"{label}.db"))
+            view = {}
+            pipeline = None
+            if behind:
+                pipeline = WriteBehind(lambda keys: store.write_many(
+                    [(key, view.get(key), None) for key in keys]))
+
+            def request(i):
+                user_id = f"user_{i % users}"
+                message = f"message {i}"
+                start = time.perf_counter()
+                view[user_id] = view.get(user_id, [])[-11:] + [("You", message, "12:00")]   # noqa: E501
+                if pipeline:
+                    pipeline.mark(user_id)
+                else:
+                    store.write_many([(user_id, view[user_id], None)])
+                return time.perf_counter() - start
+
+            with ThreadPoolExecutor(max_workers=args.workers) as pool:
+                latencies = list(pool.map(request, range(args.messages)))
+            if pipeline:
+                pipeline.close()
+            for user_id in ("user_0", f"user_{users - 1}"):
+                assert store.load(user_id)[0] == view[user_id]
+            print(f"{label}: p50 {statistics.median(latencies) * 1e6:.0f} us, "   # noqa: E501
+                  f"p99 {statistics.quantiles(latencies, n=100)[98] * 1e6:.0f} us"   # noqa: E501
+                  + (f", flush stats {pipeline.stats}" if pipeline else ""))
+
+        check_read_your_writes(os.path.join(tmp, "app.db"))
+
+
+def check_read_your_writes(path):
+    """Drive the app with a memory store whose flushes are held back.
+
+    Each step reads before the write-behind thread has flushed, so only the
+    in-memory view can make it pass.
+    """
+    import replay
+
+    class RecordingModel(replay.FakeModel):
+        def generate_content(self, prompt, stream=False):
+            prompts.append(prompt)
+            return super().generate_content(prompt, stream)
+
+    app = replay.app
+    prompts = []
+    app.router.remote = RecordingModel()
+    # What app.py sets up at import time with MEMORY_DB=path, except that
+    # nothing is flushed until flush() below
+    app.MEMORY_DB = path
+    app.user_store = UserStore(path)
+    app.write_behind = WriteBehind(app.flush_users, max_lag=3600)
+    client = app.app.test_client()
+
+    def send(text):
+        response = client.post("/process", json={"user_id": "ryw", "user_input": text})   # noqa: E501
+        assert response.status_code == 200, response.get_json()
+        return prompts[-1]
+
+    def flush():
+        app.write_behind.close()
+        app.write_behind = WriteBehind(app.flush_users, max_lag=3600)
+
+    send("apple")
+    assert app.user_store.load("ryw") is None, "flushed too early"
+    assert "apple" in send("banana"), "write then read before the flush"
+    flush()
+    assert "banana" in [entry[1] for entry in app.user_store.load("ryw")[0]]
+
+    # The reset drops the view while the store still has the old rows
+    client.post("/reset_memory", json={"user_id": "ryw"})
+    assert app.write_behind.pending("ryw")
+    assert "apple" not in send("cherry"), "view miss while pending read the store"   # noqa: E501
+    flush()
+    stored = [entry[1] for entry in app.user_store.load("ryw")[0]]
+    assert "cherry" in stored and "apple" not in stored, "write after /reset_memory"   # noqa: E501
+
+    # A view miss once nothing is pending reads through to the store
+    del app.user_memories["ryw"]
+    assert "cherry" in send("date"), "view miss after the flush"
+    app.write_behind.close()
+    print("read-your-writes through handle_message: ok")
+
+
+def wait_for(url):
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{url}/health")
+            return
+        except OSError:
+            time.sleep(0.1)
+
+
+def shard_client(urls, messages, users, route_locally, results):
+    """Send messages round-robin over users, to their shard or the router."""
+    import http.client
+    from shard_router import HashRing
+
+    ring = HashRing(urls)
+    conns = {}
+    rng = random.Random()
+    for _ in range(messages):
+        user_id = f"user_{rng.randrange(users)}"
+        url = ring.get(user_id) if route_locally else urls[0]
+        if url not in conns:
+            conns[url] = http.client.HTTPConnection(*url[7:].split(":"))
+        conns[url].request("POST", "/process", json.dumps({"user_id": user_id, "user_input": "hi"}),   # noqa: E501
+                           {"Content-Type": "application/json"})
+        conns[url].getresponse().read()
+    results.put(messages)
+
+
+def run_clients(urls, args, route_locally=True):
+    results = multiprocessing.Queue()
+    clients = [multiprocessing.Process(target=shard_client,
+                                       args=(urls, args.messages, args.users, route_locally, results))   # noqa: E501
+               for _ in range(args.workers)]
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    total = sum(results.get() for _ in clients)
+    for client in clients:
+        client.join()
+    return total / (time.perf_counter() - start)
+
+
+def route_forever(urls, port):
+    import shard_router
+    for url in urls:
+        shard_router.ring.add(url)
+    shard_router.app.run(host="127.0.0.1", port=port, threaded=True)
+
+
+def bench_shards(args):
+    """Throughput with 1..N shard processes, and through the router."""
+    base_port = 9200
+    servers = []
+    urls = []
+    try:
+        for n in range(1, args.shards + 1):
+            port = base_port + n
+            server = multiprocessing.Process(target=serve, args=(port, args.model_latency), daemon=True)   # noqa: E501
+            server.start()
+            servers.append(server)
+            urls.append(f"http://127.0.0.1:{port}")
+            wait_for(urls[-1])
+            print(f"{n} shard(s): {run_clients(urls, args):.0f} req/s")
+
+        router = multiprocessing.Process(target=route_forever, args=(urls, base_port), daemon=True)   # noqa: E501
+        router.start()
+        servers.append(router)
+        wait_for(f"http://127.0.0.1:{base_port}")
+        rate = run_clients([f"http://127.0.0.1:{base_port}"], args, route_locally=False)   # noqa: E501
+        print(f"{args.shards} shard(s) via router: {rate:.0f} req/s")
+    finally:
+        for server in servers:
+            server.terminate()
+
+
+def bench_logging(args):
+    """Logging time per request at a fixed request rate: inline vs queued."""
+    import logging
+
+    events = (("memory_read", {"user_id": "user_1", "ms": 0.04}),
+              ("model_call", {"user_id": "user_1", "tier": "Pro",
+                              "stream": True, "prompt_chars": 2400,
+                              "reply_chars": 310, "ms": 812.5}),
+              ("memory_write", {"user_id": "user_1", "seq": 14, "ms": 0.02}),
+              ("request", {"method": "POST", "status": 200, "ms": 813.1}))
+    interval = 1 / args.rps
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def inline():
+            # What logging straight from process() would do: format and write
+            # on the request thread
+            logger = logging.getLogger("bench_inline")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            handler = logging.FileHandler(os.path.join(tmp, "inline.log"))
+            handler.setFormatter(JsonFormatter())
+            logger.handlers = [handler]
+
+            def request():
+                for event, fields in events:
+                    logger.info(event, extra={"fields": fields})
+            return request, handler.close
+
+        def queued(rate):
+            def make():
+                log = StructuredLog(os.path.join(tmp, f"queued-{rate}.log"), {"*": rate})   # noqa: E501
+
+                def request():
+                    log.begin("/process")
+                    for event, fields in events:
+                        log.info(event, **fields)
+                return request, log.close
+            return make
+
+        cases = (("no logging", lambda: (lambda: None, lambda: None)),
+                 ("inline file handler", inline),
+                 ("queued, rate 1", queued(1.0)),
+                 ("queued, rate 0.1", queued(0.1)))
+        for label, make in cases:
+            request, close = make()
+            costs = []
+            next_at = time.perf_counter()
+            for _ in range(args.messages):
+                # Pace requests at --rps so the listener runs as it would live
+                next_at += interval
+                time.sleep(max(0.0, next_at - time.perf_counter()))
+                start = time.perf_counter()
+                request()
+                costs.append(time.perf_counter() - start)
+            close()
+            costs.sort()
+            print(f"{label}: {statistics.mean(costs) * 1e6:.1f} us/request, "
+                  f"p99 {costs[int(len(costs) * 0.99)] * 1e6:.1f} us, "
+                  f"{sum(costs) / (args.messages * interval) * 100:.2f}% of one core at {args.rps:.0f} req/s")   # noqa: E501
+
+
+BENCHMARKS = {
+    "profiles": bench_profiles,
+    "snapshot": bench_snapshot,
+    "channel": bench_channel,
+    "ratelimit": bench_ratelimit,
+    "schema": bench_schema,
+    "profiler": bench_profiler,
+    "local": bench_local,
+    "writebehind": bench_writebehind,
+    "shards": bench_shards,
+    "logging": bench_logging,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backend micro-benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--model-latency", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--model-path", help="GGUF model for the local benchmark")   # noqa: E501
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--rps", type=float, default=1000)
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
@@ -0,0 +1,100 @@
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import zlib
+from datetime import datetime
+
+# -----------------------------
+# Append-only event log
+# -----------------------------
+FILE_PATTERN = "events-*.jsonl.gz"
+
+
+class EventLog:
+    """Write one JSON line per request to rotated gzip files.
+
+    `write()` only puts the event on a bounded queue; a daemon thread does
+    the encoding, compression and disk I/O. When the queue is full the event
+    is dropped and counted instead of blocking the request thread. A file is
+    rotated once it holds `max_bytes` of compressed data.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 2**20, max_files=20, queue_size=10000):   # noqa: E501
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.stats = {"written": 0, "dropped": 0}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)   # noqa: E501
+        self._thread.start()
+
+    def write(self, event):
+        """Queue an event without blocking."""
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def _open(self):
+        name = f"events-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.jsonl.gz"   # noqa: E501
+        self._file = gzip.open(os.path.join(self.directory, name), "wt", encoding="utf-8")   # noqa: E501
+        for old in sorted(glob.glob(os.path.join(self.directory, FILE_PATTERN)))[:-self.max_files]:   # noqa: E501
+            os.remove(old)
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+
+    def _run(self):
+        while True:
+            event = self._queue.get()
+            batch = [event]
+            # Drain whatever else is waiting so we flush once per batch
+            while len(batch) < 1000:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in batch
+            for event in batch:
+                if event is None:
+                    continue
+                if self._file is None:
+                    self._open()
+                self._file.write(json.dumps(event, ensure_ascii=False) + "\n")
+                self.stats["written"] += 1
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                return
+            if self._file is not None:
+                self._file.flush()
+                # Compressed bytes on disk; a batch may overshoot max_bytes
+                if self._file.buffer.fileobj.tell() >= self.max_bytes:
+                    self._rotate()
+
+    def close(self, timeout=5):
+        """Flush queued events and close the current file."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+def read_events(directory):
+    """Yield logged events, oldest file first.
+
+    A file cut short by a crash is read up to its last flushed batch; a
+    corrupt file is read up to the damage and the rest of it is skipped.
+    """
+    for path in sorted(glob.glob(os.path.join(directory, FILE_PATTERN))):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    if line.endswith("\n"):
+                        yield json.loads(line)
+            except (EOFError, gzip.BadGzipFile, zlib.error):
+                continue
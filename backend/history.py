@@ -0,0 +1,129 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+from write_behind import WriteBehind
+
+
+# -----------------------------
+# Full chat history
+# -----------------------------
+def history_key(user_id, token):
+    """The key a user's messages are kept under for one session's token.
+
+    Reading them back needs both, so a guessed user_id alone finds nothing.
+    """
+    return hashlib.blake2b(f"{user_id}\n{token}".encode(), digest_size=16).hexdigest()   # noqa: E501
+
+
+class HistoryStore:
+    """Every chat message per user in SQLite, for paging and export.
+
+    `user_memories` only keeps the last few pairs for the prompt; this keeps
+    all of them. Appends are buffered and written by a WriteBehind worker,
+    and reads merge in the unflushed rows, so a user always sees their own
+    latest messages without the request waiting on the file's write lock.
+
+    Messages are numbered by `seq`: the wall clock in microseconds, made
+    strictly increasing within the process. Processes sharing the file
+    (shards) need no coordination for that, as a user is only served by one
+    of them at a time.
+    """
+
+    def __init__(self, path, max_lag=0.5):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._pending = {}
+        self._last_seq = 0
+        self._db().execute(
+            "CREATE TABLE IF NOT EXISTS messages (user_id TEXT, seq INTEGER, sender TEXT, "   # noqa: E501
+            "text TEXT, time TEXT, PRIMARY KEY (user_id, seq)) WITHOUT ROWID")
+        self.writer = WriteBehind(self._flush, max_lag=max_lag)
+
+    def _db(self):
+        """One connection per thread, in autocommit mode."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def append(self, user_id, entries):
+        """Queue (sender, text, time) entries; return the last seq used."""
+        with self._lock:
+            seq = max(time.time_ns() // 1000, self._last_seq + 1)
+            rows = [(seq + i, sender, text, ts) for i, (sender, text, ts) in enumerate(entries)]   # noqa: E501
+            self._last_seq = rows[-1][0]
+            self._pending.setdefault(user_id, []).extend(rows)
+        self.writer.mark(user_id)
+        return rows[-1][0]
+
+    def _flush(self, user_ids):
+        with self._write_lock:
+            with self._lock:
+                batch = {user_id: list(self._pending.get(user_id, ())) for user_id in user_ids}   # noqa: E501
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany("INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?)",   # noqa: E501
+                               [(user_id, *row) for user_id, rows in batch.items() for row in rows])   # noqa: E501
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            with self._lock:
+                for user_id, rows in batch.items():
+                    rest = self._pending.get(user_id, [])[len(rows):]
+                    if rest:
+                        self._pending[user_id] = rest
+                    else:
+                        self._pending.pop(user_id, None)
+
+    def _unflushed(self, user_id):
+        with self._lock:
+            return list(self._pending.get(user_id, ()))
+
+    def page(self, user_id, before=None, limit=50):
+        """Return up to `limit` messages older than `before`, oldest first.
+
+        Also returns the cursor for the next older page, or None when there
+        are no older messages.
+        """
+        before = before if before is not None else 2**62
+        pending = [row for row in self._unflushed(user_id) if row[0] < before]
+        stored = self._db().execute(
+            "SELECT seq, sender, text, time FROM messages WHERE user_id = ? AND seq < ? "   # noqa: E501
+            "ORDER BY seq DESC LIMIT ?", (user_id, before, limit + 1)).fetchall()   # noqa: E501
+        rows = sorted({row[0]: row for row in stored + pending}.values(), reverse=True)   # noqa: E501
+        more = len(rows) > limit
+        rows = rows[:limit][::-1]
+        return [{"seq": seq, "sender": sender, "text": text, "time": time}
+                for seq, sender, text, time in rows], rows[0][0] if more else None   # noqa: E501
+
+    def iter_all(self, user_id, batch=500):
+        """Yield every message of a user, oldest first, a batch at a time."""
+        pending = self._unflushed(user_id)
+        last = 0
+        while True:
+            rows = self._db().execute(
+                "SELECT seq, sender, text, time FROM messages WHERE user_id = ? AND seq > ? "   # noqa: E501
+                "ORDER BY seq LIMIT ?", (user_id, last, batch)).fetchall()
+            if not rows:
+                break
+            yield from rows
+            last = rows[-1][0]
+        yield from (row for row in pending if row[0] > last)
+
+    def delete(self, user_id):
+        with self._write_lock:
+            with self._lock:
+                self._pending.pop(user_id, None)
+            self._db().execute("DELETE FROM messages WHERE user_id = ?", (user_id,))   # noqa: E501
+
+    def close(self):
+        self.writer.close()
@@ -0,0 +1,244 @@
+import threading
+import time
+
+import numpy as np
+
+# -----------------------------
+# Codes
+# -----------------------------
+EMOTIONS = ("neutral", "positive", "negative")
+RELATIONSHIP_TYPES = ("friend", "mentor", "partner", "mother", "father", "sibling")   # noqa: E501
+
+EMPTY = -1
+HISTORY_SIZE = 10
+COLUMNS = ("history", "history_relationship", "head", "conversation_count", "relationship", "last_active")   # noqa: E501
+
+
+def encode(values, value):
+    """Return the int code of value, falling back to the first entry."""
+    try:
+        return values.index(value)
+    except ValueError:
+        return 0
+
+
+# -----------------------------
+# Columnar profile store
+# -----------------------------
+class ProfileStore:
+    """User profiles kept as NumPy columns indexed by an interned user id.
+
+    Each user owns one row: an int8 ring of the last HISTORY_SIZE emotion
+    codes with a parallel ring of the relationship type each was recorded
+    under, the ring write position, the conversation count, the last
+    relationship type used and `last_active` in epoch seconds.
+    """
+
+    def __init__(self, capacity=1024, history_size=HISTORY_SIZE):
+        self.history_size = history_size
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._names = []
+        self._free = []
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.history = np.full((capacity, self.history_size), EMPTY, dtype=np.int8)   # noqa: E501
+        self.history_relationship = np.full((capacity, self.history_size), EMPTY, dtype=np.int8)   # noqa: E501
+        self.head = np.zeros(capacity, dtype=np.uint8)
+        self.conversation_count = np.zeros(capacity, dtype=np.int32)
+        self.relationship = np.full(capacity, EMPTY, dtype=np.int8)
+        self.last_active = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self):
+        old = [getattr(self, name) for name in COLUMNS]
+        size = len(self.head)
+        self._allocate(size * 2)
+        for name, current in zip(COLUMNS, old):
+            getattr(self, name)[:size] = current
+
+    def _row(self, user_id):
+        """Intern user_id and return its row, allocating one if needed."""
+        row = self._ids.get(user_id)
+        if row is not None:
+            return row
+        if self._free:
+            row = self._free.pop()
+            self._names[row] = user_id
+        else:
+            row = len(self._names)
+            if row == len(self.head):
+                self._grow()
+            self._names.append(user_id)
+        self._ids[user_id] = row
+        self.last_active[row] = int(time.time())
+        return row
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, user_id):
+        return user_id in self._ids
+
+    def ids(self):
+        """Return the ids of every user with a profile."""
+        with self._lock:
+            return list(self._ids)
+
+    # -----------------------------
+    # Per-user access
+    # -----------------------------
+    def record(self, user_id, emotion, relationship_type=None, now=None):
+        """Count one interaction and push its emotion into the user's ring."""
+        with self._lock:
+            row = self._row(user_id)
+            if relationship_type is not None:
+                self.relationship[row] = encode(RELATIONSHIP_TYPES, relationship_type)   # noqa: E501
+            pos = self.head[row]
+            self.history[row, pos] = encode(EMOTIONS, emotion)
+            self.history_relationship[row, pos] = self.relationship[row]
+            self.head[row] = (pos + 1) % self.history_size
+            self.conversation_count[row] += 1
+            self.last_active[row] = int(time.time() if now is None else now)
+
+    def recent_emotions(self, user_id, n=None):
+        """Return the user's emotion history, oldest first."""
+        with self._lock:
+            row = self._ids.get(user_id)
+            if row is None:
+                return []
+            ring = np.roll(self.history[row], -int(self.head[row]))
+        codes = ring[ring != EMPTY]
+        if n is not None:
+            codes = codes[-n:]
+        return [EMOTIONS[code] for code in codes]
+
+    def get(self, user_id):
+        """Return a dict view of the user's profile, creating it if needed."""
+        with self._lock:
+            self._row(user_id)
+        return self.peek(user_id)
+
+    def peek(self, user_id):
+        """Return a dict view of the user's profile, or None if unknown."""
+        with self._lock:
+            row = self._ids.get(user_id)
+            if row is None:
+                return None
+            count = int(self.conversation_count[row])
+            relationship = int(self.relationship[row])
+            last_active = int(self.last_active[row])
+            shift = -int(self.head[row])
+            ring = np.roll(self.history[row], shift)
+            ring_relationship = np.roll(self.history_relationship[row], shift)
+        kept = ring != EMPTY
+        return {
+            "conversation_count": count,
+            "communication_style": "balanced",
+            "emotional_state_history": [EMOTIONS[code] for code in ring[kept]],   # noqa: E501
+            # The relationship type each emotion above was recorded under
+            "relationship_history": [RELATIONSHIP_TYPES[code] if code != EMPTY else None   # noqa: E501
+                                     for code in ring_relationship[kept]],
+            "relationship_type": RELATIONSHIP_TYPES[relationship] if relationship != EMPTY else None,   # noqa: E501
+            "last_active": last_active
+        }
+
+    def put(self, user_id, profile):
+        """Replace a user's row from a dict returned by `peek()`."""
+        history = [encode(EMOTIONS, e) for e in profile["emotional_state_history"]]   # noqa: E501
+        history = history[-self.history_size:]
+        relationship_type = profile.get("relationship_type")
+        # Profiles stored before relationship_history existed: assume the
+        # last relationship type for every entry
+        relationships = profile.get("relationship_history") or [relationship_type] * len(history)   # noqa: E501
+        relationships = [EMPTY if r is None else encode(RELATIONSHIP_TYPES, r)
+                         for r in relationships][-self.history_size:]
+        with self._lock:
+            row = self._row(user_id)
+            self.history[row] = EMPTY
+            self.history[row, :len(history)] = history
+            self.history_relationship[row] = EMPTY
+            self.history_relationship[row, :len(history)] = relationships
+            self.head[row] = len(history) % self.history_size
+            self.conversation_count[row] = profile["conversation_count"]
+            self.relationship[row] = EMPTY if relationship_type is None else encode(RELATIONSHIP_TYPES, relationship_type)   # noqa: E501
+            self.last_active[row] = profile["last_active"]
+
+    def remove(self, user_id):
+        """Drop a user's profile and recycle its row."""
+        with self._lock:
+            row = self._ids.pop(user_id, None)
+            if row is None:
+                return
+            self._names[row] = None
+            self.history[row] = EMPTY
+            self.history_relationship[row] = EMPTY
+            self.head[row] = 0
+            self.conversation_count[row] = 0
+            self.relationship[row] = EMPTY
+            self.last_active[row] = 0
+            self._free.append(row)
+
+    # -----------------------------
+    # Vectorized analytics
+    # -----------------------------
+    def _used(self):
+        return len(self._names)
+
+    def active_since(self, minutes, now=None):
+        """Return the ids of users active in the last `minutes` minutes."""
+        cutoff = int(time.time() if now is None else now) - int(minutes * 60)
+        with self._lock:
+            used = self._used()
+            rows = np.flatnonzero(self.last_active[:used] >= cutoff)
+            return [self._names[row] for row in rows]
+
+    def count_active_since(self, minutes, now=None):
+        """Return how many users were active in the last `minutes` minutes."""
+        cutoff = int(time.time() if now is None else now) - int(minutes * 60)
+        with self._lock:
+            return int(np.count_nonzero(self.last_active[:self._used()] >= cutoff))   # noqa: E501
+
+    def emotion_distribution(self):
+        """Count stored emotions per relationship type across all users."""
+        with self._lock:
+            used = self._used()
+            history = self.history[:used]
+            rel = self.history_relationship[:used]
+            mask = (history != EMPTY) & (rel != EMPTY)
+            keys = rel[mask].astype(np.intp) * len(EMOTIONS) + history[mask]
+        counts = np.bincount(keys, minlength=len(RELATIONSHIP_TYPES) * len(EMOTIONS))   # noqa: E501
+        counts = counts.reshape(len(RELATIONSHIP_TYPES), len(EMOTIONS))
+        return {
+            relationship_type: dict(zip(EMOTIONS, map(int, row)))
+            for relationship_type, row in zip(RELATIONSHIP_TYPES, counts)
+        }
+
+    @property
+    def nbytes(self):
+        """Bytes held by the NumPy columns."""
+        return sum(getattr(self, name).nbytes for name in COLUMNS)
+
+    # -----------------------------
+    # Snapshot support
+    # -----------------------------
+    def export(self):
+        """Return copies of the used columns and the id table."""
+        with self._lock:
+            used = self._used()
+            columns = {name: getattr(self, name)[:used].copy() for name in COLUMNS}   # noqa: E501
+            names = list(self._names)
+        return columns, names
+
+    def load(self, columns, names):
+        """Replace the store contents with exported columns and ids."""
+        with self._lock:
+            used = len(names)
+            self._allocate(max(used, len(self.head)))
+            for name in COLUMNS:
+                # Snapshots from before a column existed leave it empty
+                if name in columns:
+                    getattr(self, name)[:used] = columns[name]
+            self._names = list(names)
+            self._ids = {name: row for row, name in enumerate(names) if name is not None}   # noqa: E501
+            self._free = [row for row, name in enumerate(names) if name is None]   # noqa: E501
@@ -0,0 +1,120 @@
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+NULL_CONTEXT = nullcontext()
+TRUNCATED = "[truncated: too many distinct stacks]"
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"   # noqa: E501
+
+
+def collapse(frame):
+    """Return a frame's stack as 'root;...;leaf', flamegraph.pl style."""
+    labels = []
+    while frame is not None:
+        labels.append(frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+# -----------------------------
+# Sampling profiler
+# -----------------------------
+class RequestProfiler:
+    """Sample the stacks of threads that are serving profiled requests.
+
+    Disabled unless a token is configured. A request is profiled when it
+    presents the token or is picked at `sample_rate`; while at least one
+    such request runs, a daemon thread reads its stack every `interval`
+    seconds via sys._current_frames(). Other requests pay one attribute
+    check. At most `max_stacks` distinct stacks are kept; samples of any
+    further stacks are counted under TRUNCATED until the next reset().
+    """
+
+    def __init__(self, token=None, sample_rate=0.0, interval=0.005, max_stacks=20000):   # noqa: E501
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.samples = Counter()
+        self.profiled_requests = 0
+        self._active = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def authorized(self, token):
+        """True if token matches the configured one (constant-time)."""
+        if not self.token or token is None:
+            return False
+        return hmac.compare_digest(token.encode(), self.token.encode())
+
+    def sampled(self, token=None):
+        """Context manager profiling the current request if it is chosen."""
+        if not self.token:
+            return NULL_CONTEXT
+        if self.authorized(token) or (self.sample_rate and random.random() < self.sample_rate):   # noqa: E501
+            return _Sampling(self)
+        return NULL_CONTEXT
+
+    def _start(self, thread_id):
+        with self._lock:
+            self._active.add(thread_id)
+            self.profiled_requests += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)   # noqa: E501
+                self._thread.start()
+        self._wake.set()
+
+    def _stop(self, thread_id):
+        with self._lock:
+            self._active.discard(thread_id)
+            if not self._active:
+                self._wake.clear()
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            self._wake.wait()
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id in self._active:
+                    frame = frames.get(thread_id)
+                    if frame is not None and thread_id != me:
+                        stack = collapse(frame)
+                        if stack not in self.samples and len(self.samples) >= self.max_stacks:   # noqa: E501
+                            stack = TRUNCATED
+                        self.samples[stack] += 1
+            del frames
+            time.sleep(self.interval)
+
+    def collapsed(self):
+        """All samples as collapsed stacks, one 'stack count' per line."""
+        with self._lock:
+            samples = list(self.samples.items())
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(samples))   # noqa: E501
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+            self.profiled_requests = 0
+
+
+class _Sampling:
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def __enter__(self):
+        self.thread_id = threading.get_ident()
+        self.profiler._start(self.thread_id)
+
+    def __exit__(self, *exc):
+        self.profiler._stop(self.thread_id)
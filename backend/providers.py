@@ -0,0 +1,189 @@
+import os
+import queue
+import threading
+import time
+
+# -----------------------------
+# Provider interface
+# -----------------------------
+# A provider is anything with the google.generativeai model call shape:
+# generate_content(prompt) returns an object with `.text`, and
+# generate_content(prompt, stream=True) returns an iterable of such chunks.
+
+
+class TextResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class ModelBusy(Exception):
+    """The local model's backlog is full or a reply took too long."""
+
+
+def is_outage(error):
+    """True if error means the provider is down, not that it refused a prompt.
+
+    Transport errors and HTTP 5xx count; google.api_core errors carry the
+    HTTP status in `code`.
+    """
+    if isinstance(error, OSError):
+        return True
+    code = getattr(error, "code", None)
+    return isinstance(code, int) and code >= 500
+
+
+# -----------------------------
+# Local CPU model
+# -----------------------------
+class LocalModel:
+    """A small quantized GGUF model run on CPU through llama.cpp.
+
+    The model is loaded once. llama.cpp contexts are not thread-safe, so a
+    single worker thread owns it and request threads queue prompts to it.
+    Prompt tokens are evaluated in batches of `n_batch`. At most
+    `max_backlog` prompts wait; beyond that, or when no text arrives for
+    `timeout` seconds, the call raises ModelBusy instead of hanging.
+    """
+
+    name = "local"
+
+    def __init__(self, model_path, n_ctx=4096, n_threads=None, n_batch=512, max_tokens=160,   # noqa: E501
+                 max_backlog=4, timeout=60):
+        # Optional dependency: only needed when LOCAL_MODEL_PATH is set
+        from llama_cpp import Llama
+
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, n_batch=n_batch,
+                         n_threads=n_threads or os.cpu_count(), verbose=False)   # noqa: E501
+        self._jobs = queue.Queue(maxsize=max_backlog)
+        self._thread = threading.Thread(target=self._run, name="local-model", daemon=True)   # noqa: E501
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            prompt, out, cancelled = self._jobs.get()
+            if cancelled.is_set():
+                continue
+            try:
+                for piece in self.llm.create_chat_completion(
+                        messages=[{"role": "user", "content": prompt}],
+                        max_tokens=self.max_tokens, stream=True):
+                    if cancelled.is_set():
+                        break
+                    text = piece["choices"][0]["delta"].get("content")
+                    if text:
+                        out.put(text)
+                out.put(None)
+            except Exception as e:
+                out.put(e)
+
+    def _stream(self, prompt):
+        out = queue.Queue()
+        cancelled = threading.Event()
+        try:
+            self._jobs.put_nowait((prompt, out, cancelled))
+        except queue.Full:
+            raise ModelBusy("Local model is busy, try again shortly") from None   # noqa: E501
+        try:
+            while True:
+                try:
+                    item = out.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise ModelBusy("Local model timed out") from None
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield TextResponse(item)
+        finally:
+            # On a timeout, or when the caller stops reading (a WebSocket
+            # client left mid-reply), the worker skips or stops the job
+            cancelled.set()
+
+    def generate_content(self, prompt, stream=False):
+        if stream:
+            return self._stream(prompt)
+        return TextResponse("".join(chunk.text for chunk in self._stream(prompt)))   # noqa: E501
+
+
+# -----------------------------
+# Router
+# -----------------------------
+class ModelRouter:
+    """Send each prompt to the remote model or the local fallback.
+
+    Tiers in `local_tiers` always use the local model. The remote model is
+    marked unhealthy after `failure_threshold` consecutive outages (see
+    is_outage) and is skipped for `cooldown` seconds; a remote call that
+    hit an outage before streaming anything is retried locally. Other
+    errors, such as a blocked prompt, are raised as they are.
+    """
+
+    def __init__(self, remote, local=None, local_tiers=("Basic",), failure_threshold=3, cooldown=30):   # noqa: E501
+        self.remote = remote
+        self.local = local
+        self.local_tiers = set(local_tiers)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.unhealthy_until = 0.0
+
+    @property
+    def remote_healthy(self):
+        return self.remote is not None and time.monotonic() >= self.unhealthy_until   # noqa: E501
+
+    def _failed(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.unhealthy_until = time.monotonic() + self.cooldown
+
+    def _succeeded(self):
+        self.failures = 0
+
+    def use_local(self, tier):
+        if self.local is None:
+            return False
+        return tier in self.local_tiers or not self.remote_healthy
+
+    def generate_content(self, prompt, tier=None, stream=False):
+        if self.use_local(tier):
+            return self.local.generate_content(prompt, stream=stream)
+        if stream:
+            return self._stream_remote(prompt)
+        try:
+            response = self.remote.generate_content(prompt)
+            text = response.text
+        except Exception as e:
+            if not is_outage(e):
+                raise
+            self._failed()
+            if self.local is None:
+                raise
+            return self.local.generate_content(prompt)
+        self._succeeded()
+        return TextResponse(text)
+
+    def _stream_remote(self, prompt):
+        started = False
+        try:
+            for chunk in self.remote.generate_content(prompt, stream=True):
+                started = True
+                yield chunk
+        except Exception as e:
+            if not is_outage(e):
+                raise
+            self._failed()
+            if started or self.local is None:
+                raise
+            yield from self.local.generate_content(prompt, stream=True)
+            return
+        self._succeeded()
+
+    @property
+    def stats(self):
+        return {
+            "remote_healthy": self.remote_healthy,
+            "remote_failures": self.failures,
+            "local_model": self.local is not None
+        }
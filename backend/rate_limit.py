@@ -0,0 +1,105 @@
+import sqlite3
+import threading
+import time
+
+# -----------------------------
+# Limits: (tokens per second, burst)
+# -----------------------------
+TIER_LIMITS = {
+    "Basic": {"user": (10 / 60, 5), "tier": (20, 40)},
+    "Lite": {"user": (20 / 60, 8), "tier": (20, 40)},
+    "Pro": {"user": (60 / 60, 15), "tier": (30, 60)}
+}
+GLOBAL_LIMIT = (50, 100)
+IDLE_SECONDS = 3600
+
+
+# -----------------------------
+# Token-bucket limiter
+# -----------------------------
+class RateLimiter:
+    """Per-user, per-tier and global token buckets shared through SQLite.
+
+    Every worker process on the host opens the same database file, so the
+    buckets hold across processes. A request takes one token from each of
+    its three buckets inside a single IMMEDIATE transaction, or none if any
+    bucket is empty. A request waits at most `busy_timeout` seconds for the
+    lock; after that acquire() raises sqlite3.OperationalError, and the
+    caller decides whether to let the request through.
+    """
+
+    def __init__(self, path, tier_limits=TIER_LIMITS, global_limit=GLOBAL_LIMIT, prune_every=10000,   # noqa: E501
+                 busy_timeout=0.005):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.tier_limits = tier_limits
+        self.global_limit = global_limit
+        self.prune_every = prune_every
+        self._calls = 0
+        self._local = threading.local()
+        # Startup may wait for other processes; requests may not
+        db = sqlite3.connect(path, timeout=10, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS buckets "
+            "(key TEXT PRIMARY KEY, tokens REAL, updated REAL) WITHOUT ROWID")
+        db.close()
+
+    def _db(self):
+        """One connection per thread, in autocommit mode."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)   # noqa: E501
+            db.execute("PRAGMA journal_mode=WAL")
+            # Buckets are soft state; losing the last writes on a crash is fine   # noqa: E501
+            db.execute("PRAGMA synchronous=OFF")
+            self._local.db = db
+        return db
+
+    def acquire(self, user_id, tier, now=None):
+        """Take a token for one request.
+
+        Returns 0 when the request may proceed, otherwise the number of
+        seconds to wait before retrying.
+        """
+        if tier not in self.tier_limits:
+            tier = "Basic"
+        limits = self.tier_limits[tier]
+        buckets = {
+            f"user:{user_id}": limits["user"],
+            f"tier:{tier}": limits["tier"],
+            "global": self.global_limit
+        }
+        now = time.time() if now is None else now
+
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            rows = {key: (tokens, updated) for key, tokens, updated in db.execute(   # noqa: E501
+                "SELECT key, tokens, updated FROM buckets WHERE key IN (?, ?, ?)", tuple(buckets))}   # noqa: E501
+            wait = 0.0
+            levels = {}
+            for key, (rate, burst) in buckets.items():
+                tokens, updated = rows.get(key, (burst, now))
+                tokens = min(burst, tokens + max(now - updated, 0) * rate)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                levels[key] = tokens
+            if not wait:
+                db.executemany("INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",   # noqa: E501
+                               [(key, tokens - 1, now) for key, tokens in levels.items()])   # noqa: E501
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        self._calls += 1
+        if self._calls % self.prune_every == 0:
+            self.prune(now)
+        return wait
+
+    def prune(self, now=None):
+        """Forget user buckets idle long enough to have refilled."""
+        now = time.time() if now is None else now
+        self._db().execute("DELETE FROM buckets WHERE key LIKE 'user:%' AND updated < ?",   # noqa: E501
+                           (now - IDLE_SECONDS,))
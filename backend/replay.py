@@ -0,0 +1,110 @@
+import argparse
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Replay never talks to Gemini and must not log, snapshot, rate limit, keep
+# history or write through to the memory store itself (errors are still
+# logged)
+os.environ.setdefault("GEMINI_API_KEY", "replay")
+os.environ["EVENT_LOG_DIR"] = ""
+os.environ["SNAPSHOT_PATH"] = ""
+os.environ["RATE_LIMIT_DB"] = ""
+os.environ["LOCAL_MODEL_PATH"] = ""
+os.environ["HISTORY_DB"] = ""
+os.environ["MEMORY_DB"] = ""
+os.environ["LOG_SAMPLE_RATES"] = "*=0"
+
+import app  # noqa: E402
+from event_log import read_events  # noqa: E402
+
+
+# -----------------------------
+# Fake model
+# -----------------------------
+class FakeResponse:
+    def __init__(self, text, chunk_chars=40):
+        self.text = text
+        self.chunk_chars = chunk_chars
+
+    def __iter__(self):
+        """Yield the reply in pieces, like a streamed Gemini response."""
+        for i in range(0, len(self.text), self.chunk_chars):
+            yield FakeResponse(self.text[i:i + self.chunk_chars])
+
+
+class FakeModel:
+    """Stand-in for the Gemini model with a fixed latency and reply size."""
+
+    def __init__(self, latency=0.0, reply_chars=200):
+        self.latency = latency
+        self.reply = ("Hmm... " * (reply_chars // 7 + 1))[:reply_chars]
+
+    def generate_content(self, prompt, stream=False):
+        if self.latency:
+            time.sleep(self.latency)
+        return FakeResponse(self.reply)
+
+
+# -----------------------------
+# Replay
+# -----------------------------
+def replay(events, speed=1.0, workers=16):
+    """POST logged requests to /process, keeping their relative timing.
+
+    speed=1 replays in real time, speed=10 ten times faster and speed=0 as
+    fast as the workers allow. Returns per-request latencies in seconds.
+    """
+    client_local = threading.local()
+    latencies = []
+    errors = 0
+
+    def send(event):
+        nonlocal errors
+        if not hasattr(client_local, "client"):
+            client_local.client = app.app.test_client()
+        payload = {key: event[key] for key in app.REQUEST_FIELDS if key in event}   # noqa: E501
+        start = time.perf_counter()
+        response = client_local.client.post("/process", json=payload)
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            errors += 1
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        first_ts = None
+        started = time.perf_counter()
+        for event in events:
+            if speed:
+                first_ts = event["ts"] if first_ts is None else first_ts
+                delay = (event["ts"] - first_ts) / speed - (time.perf_counter() - started)   # noqa: E501
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(send, event)
+    return latencies, errors, time.perf_counter() - started
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]   # noqa: E501
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay an event log against the fake model")   # noqa: E501
+    parser.add_argument("log_dir", help="directory written via EVENT_LOG_DIR")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="1 = real time, 10 = 10x faster, 0 = no pacing")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--model-latency", type=float, default=0.0,
+                        help="seconds the fake model sleeps per call")
+    args = parser.parse_args()
+
+    app.router.remote = FakeModel(latency=args.model_latency)
+    latencies, errors, elapsed = replay(read_events(args.log_dir), args.speed, args.workers)   # noqa: E501
+    if not latencies:
+        raise SystemExit("No events found")
+
+    print(f"requests: {len(latencies)}, errors: {errors}, "
+          f"throughput: {len(latencies) / elapsed:.1f} req/s")
+    print(f"latency ms p50: {percentile(latencies, 50) * 1000:.2f}, "
+          f"p99: {percentile(latencies, 99) * 1000:.2f}")
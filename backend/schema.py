@@ -0,0 +1,89 @@
+from typing import Annotated, List, Literal, Optional, Union
+
+import msgspec
+from msgspec import Meta
+
+from profile_store import RELATIONSHIP_TYPES
+
+# -----------------------------
+# Field types
+# -----------------------------
+MAX_INPUT_CHARS = 2000
+
+Tier = Literal["Basic", "Lite", "Pro"]
+RelationshipType = Literal[RELATIONSHIP_TYPES]
+AiBehavior = Literal["caring", "funny", "wise", "energetic", "calm", "playful",   # noqa: E501
+                     "romantic", "intellectual", "supportive", "mysterious"]
+Gender = Literal["male", "female", "other"]
+UserInput = Annotated[str, Meta(max_length=MAX_INPUT_CHARS)]
+UserId = Annotated[str, Meta(min_length=1, max_length=64)]
+ShortText = Annotated[str, Meta(max_length=64)]
+# A secret the client makes up per session; see GET /history
+HistoryToken = Annotated[str, Meta(min_length=16, max_length=64)]
+MessageId = Union[int, str, None]
+
+
+# -----------------------------
+# Requests
+# -----------------------------
+class ChatRequest(msgspec.Struct):
+    """Body of POST /process and of each message on /chat."""
+    user_input: UserInput = ""
+    relationship_type: RelationshipType = "friend"
+    tier: Tier = "Basic"
+    user_id: UserId = "user_001"
+    region: ShortText = "Maharashtra"
+    tz: ShortText = "Asia/Kolkata"
+    user_gender: Gender = "male"
+    ai_gender: Gender = "female"
+    language: ShortText = "English"
+    ai_behavior: AiBehavior = "caring"
+    # Without one, the message isn't kept in the history
+    history_token: Optional[HistoryToken] = None
+    # Only sent on /chat, to match streamed frames to their message
+    id: MessageId = None
+
+
+class ResetRequest(msgspec.Struct):
+    user_id: UserId = "user_001"
+    history_token: Optional[HistoryToken] = None
+
+
+class EvictRequest(msgspec.Struct):
+    """Body of POST /evict: the router's shard list and this shard's URL."""
+    shards: List[str]
+    url: str
+
+
+# -----------------------------
+# Responses
+# -----------------------------
+class ChatReply(msgspec.Struct, omit_defaults=True):
+    reply: str
+    typing_delay: float
+    conversation_count: int
+    # Position of the reply in the user's history (see GET /history)
+    seq: Optional[int] = None
+    type: Optional[str] = None
+    id: MessageId = None
+
+
+class ErrorReply(msgspec.Struct, omit_defaults=True):
+    error: str
+    retry_after: Optional[float] = None
+    type: Optional[str] = None
+    id: MessageId = None
+
+
+class ChunkFrame(msgspec.Struct):
+    id: MessageId
+    text: str
+    type: str = "chunk"
+
+
+# Compiled once: decoding validates types, lengths and enums in one pass
+chat_request_decoder = msgspec.json.Decoder(ChatRequest)
+reset_request_decoder = msgspec.json.Decoder(ResetRequest)
+evict_request_decoder = msgspec.json.Decoder(EvictRequest)
+encoder = msgspec.json.Encoder()
+DecodeError = msgspec.DecodeError  # ValidationError is a subclass
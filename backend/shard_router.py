@@ -0,0 +1,303 @@
+import argparse
+import atexit
+import bisect
+import hashlib
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+from urllib.parse import urlsplit
+
+import msgspec
+from flask import Flask, Response, request
+from flask_sock import Sock
+from simple_websocket import Client
+
+from schema import DecodeError, ErrorReply, encoder, reset_request_decoder
+
+
+# -----------------------------
+# Consistent hashing
+# -----------------------------
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")   # noqa: E501
+
+
+class HashRing:
+    """Map keys to shards so adding or removing a shard moves ~1/N of keys.
+
+    Each shard is placed on the ring `replicas` times to even out the load.
+    """
+
+    def __init__(self, shards=(), replicas=160):
+        self.replicas = replicas
+        self.shards = []
+        self._ring = ([], [])
+        for shard in shards:
+            self.add(shard)
+
+    def _rebuild(self):
+        points = sorted((ring_hash(f"{shard}#{i}"), shard)
+                        for shard in self.shards for i in range(self.replicas))
+        # Swapped in as one tuple so concurrent get() never sees a mix
+        self._ring = ([point for point, _ in points], [shard for _, shard in points])   # noqa: E501
+
+    def add(self, shard):
+        if shard not in self.shards:
+            self.shards.append(shard)
+            self._rebuild()
+
+    def remove(self, shard):
+        if shard in self.shards:
+            self.shards.remove(shard)
+            self._rebuild()
+
+    def get(self, key):
+        points, owners = self._ring
+        if not points:
+            raise LookupError("No shards configured")
+        return owners[bisect.bisect(points, ring_hash(key)) % len(points)]
+
+
+# -----------------------------
+# Router app
+# -----------------------------
+app = Flask(__name__)
+sock = Sock(app)
+ring = HashRing()
+_local = threading.local()
+# One /shards change at a time
+handoff_lock = threading.Lock()
+
+
+class Frame(msgspec.Struct):
+    type: str = ""
+
+
+frame_decoder = msgspec.json.Decoder(Frame)
+
+
+def json_response(body, status=200):
+    return Response(encoder.encode(body), status, mimetype="application/json")
+
+
+def connection(shard):
+    """Keep-alive HTTP connection to a shard, one per router thread."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(shard)
+    if conn is None:
+        url = urlsplit(shard)
+        conn = conns[shard] = http.client.HTTPConnection(url.hostname, url.port, timeout=60)   # noqa: E501
+    return conn
+
+
+RELAYED_HEADERS = ("Retry-After", "Content-Disposition", "Access-Control-Allow-Origin",   # noqa: E501
+                   "Access-Control-Allow-Headers", "Vary", "X-Request-Id")
+
+
+def forward(shard, method, path, body=None, stream=False):
+    """Send one request to a shard and relay its response.
+
+    With stream=True the body is passed through as it arrives.
+    """
+    headers = {"Content-Type": "application/json"}
+    for name in ("X-Profile-Token", "X-History-Token", "X-Request-Id", "Origin"):   # noqa: E501
+        if name in request.headers:
+            headers[name] = request.headers[name]
+    conn = connection(shard)
+    try:
+        conn.request(method, path, body, headers)
+    except ConnectionError:
+        # The shard closed an idle connection; retry once on a fresh one
+        conn.close()
+        conn.request(method, path, body, headers)
+    response = conn.getresponse()
+    relayed = {name: value for name, value in response.getheaders() if name in RELAYED_HEADERS}   # noqa: E501
+    content_type = response.getheader("Content-Type", "application/json")
+    if not stream:
+        return Response(response.read(), response.status, relayed, content_type=content_type)   # noqa: E501
+
+    def relay():
+        try:
+            yield from iter(lambda: response.read(65536), b"")
+        finally:
+            # A download the client abandoned leaves the connection unusable
+            if not response.isclosed():
+                conn.close()
+    return Response(relay(), response.status, relayed, content_type=content_type)   # noqa: E501
+
+
+def send_to_owner(user_id, method, path, body=None, stream=False):
+    shard = ring.get(user_id)
+    try:
+        return forward(shard, method, path, body, stream)
+    except (OSError, http.client.HTTPException) as e:
+        connection(shard).close()
+        return json_response(ErrorReply(f"Shard unavailable: {e}"), 502)
+
+
+def route_user(path):
+    body = request.get_data()
+    try:
+        user_id = reset_request_decoder.decode(body).user_id
+    except DecodeError as e:
+        return json_response(ErrorReply(f"Invalid request: {e}"), 400)
+    return send_to_owner(user_id, "POST", path, body)
+
+
+def route_query(path, stream=False):
+    """Forward a GET (or its CORS preflight) that names its user in ?user_id=."""   # noqa: E501
+    user_id = request.args.get("user_id", "")
+    if not user_id:
+        return json_response(ErrorReply("user_id is required"), 400)
+    query = request.query_string.decode()
+    return send_to_owner(user_id, request.method, f"{path}?{query}", stream=stream)   # noqa: E501
+
+
+@app.route('/process', methods=['POST'])
+def process():
+    return route_user("/process")
+
+
+@app.route('/reset_memory', methods=['POST'])
+def reset_memory():
+    return route_user("/reset_memory")
+
+
+@app.route('/history', methods=['GET', 'OPTIONS'])
+def history():
+    return route_query("/history")
+
+
+@app.route('/history/export', methods=['GET', 'POST'])
+def export_history():
+    return route_query("/history/export", stream=True)
+
+
+@sock.route('/chat')
+def chat(ws):
+    """Relay each message to its user's shard over a per-shard WebSocket."""
+    ws.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    upstreams = {}
+    try:
+        while True:
+            raw = ws.receive()
+            try:
+                shard = ring.get(reset_request_decoder.decode(raw).user_id)
+            except DecodeError as e:
+                ws.send(encoder.encode(ErrorReply(f"Invalid request: {e}", type="error")).decode())   # noqa: E501
+                continue
+            upstream = upstreams.get(shard)
+            if upstream is None:
+                url = urlsplit(shard)
+                upstream = upstreams[shard] = Client.connect(f"ws://{url.netloc}/chat")   # noqa: E501
+                upstream.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)   # noqa: E501
+            upstream.send(raw)
+            while True:
+                frame = upstream.receive()
+                ws.send(frame)
+                if frame_decoder.decode(frame).type != "chunk":
+                    break
+    finally:
+        for upstream in upstreams.values():
+            upstream.close()
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Health of every shard, plus the total of active users."""
+    shards = {}
+    active_users = 0
+    for shard in list(ring.shards):
+        try:
+            conn = connection(shard)
+            conn.request("GET", "/health")
+            health = msgspec.json.decode(conn.getresponse().read())
+            active_users += health.get("active_users", 0)
+            shards[shard] = health.get("status", "unknown")
+        except (OSError, http.client.HTTPException, msgspec.DecodeError):
+            connection(shard).close()
+            shards[shard] = "offline"
+    status = "healthy" if shards and all(s == "healthy" for s in shards.values()) else "degraded"   # noqa: E501
+    return json_response({"status": status, "active_users": active_users, "shards": shards})   # noqa: E501
+
+
+def evict_moved(shard, shards):
+    """Give a shard the next shard list so it drops the users it loses.
+
+    Returns how many users it evicted, or "offline".
+    """
+    body = encoder.encode({"shards": shards, "url": shard})
+    try:
+        conn = connection(shard)
+        conn.request("POST", "/evict", body, {"Content-Type": "application/json"})   # noqa: E501
+        return msgspec.json.decode(conn.getresponse().read()).get("evicted")
+    except (OSError, http.client.HTTPException, msgspec.DecodeError):
+        connection(shard).close()
+        return "offline"
+
+
+@app.route('/shards', methods=['GET', 'POST', 'DELETE'])
+def shards():
+    """List shards, or add/remove one with {"url": "http://host:port"}.
+
+    The handoff is two-phase: every shard first takes the new list, writes
+    out and forgets the users it loses and refuses them from then on (409);
+    only then does the router send those users to their new owners.
+    """
+    if request.method != 'GET':
+        url = (request.get_json(silent=True) or {}).get("url")
+        if not isinstance(url, str) or not url.startswith("http://"):
+            return json_response(ErrorReply("url must be an http:// URL"), 400)
+        url = url.rstrip("/")
+        with handoff_lock:
+            new = [shard for shard in ring.shards if shard != url]
+            if request.method == 'POST':
+                new.append(url)
+            evicted = {shard: evict_moved(shard, new) for shard in set(ring.shards) | {url}}   # noqa: E501
+            if request.method == 'POST':
+                ring.add(url)
+            else:
+                ring.remove(url)
+        return json_response({"shards": ring.shards, "evicted": evicted})
+    return json_response({"shards": ring.shards})
+
+
+# -----------------------------
+# Local shard processes
+# -----------------------------
+def spawn_shards(count, base_port):
+    """Start `count` backends on consecutive ports; return their URLs."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    snapshot_path = os.environ.get("SNAPSHOT_PATH", "state.snap")
+    procs = []
+    for port in range(base_port, base_port + count):
+        # Each shard snapshots its own users; MEMORY_DB and HISTORY_DB are
+        # shared, so a user who moves keeps their memory and history
+        env = dict(os.environ, PORT=str(port), DEBUG="0",
+                   SNAPSHOT_PATH=f"{os.path.splitext(snapshot_path)[0]}-{port}.snap" if snapshot_path else "")   # noqa: E501
+        procs.append(subprocess.Popen([sys.executable, os.path.join(here, "app.py")], env=env))   # noqa: E501
+    atexit.register(lambda: [proc.terminate() for proc in procs])
+    return [f"http://127.0.0.1:{port}" for port in range(base_port, base_port + count)]   # noqa: E501
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Route users to backend shards by consistent hashing")   # noqa: E501
+    parser.add_argument("--shards", default="", help="comma-separated backend URLs")   # noqa: E501
+    parser.add_argument("--spawn", type=int, default=0, help="start N local backends")   # noqa: E501
+    parser.add_argument("--base-port", type=int, default=9001)
+    parser.add_argument("--port", type=int, default=9000)
+    args = parser.parse_args()
+
+    urls = [url.rstrip("/") for url in args.shards.split(",") if url]
+    if args.spawn:
+        urls += spawn_shards(args.spawn, args.base_port)
+    for url in urls:
+        ring.add(url)
+
+    print(f"🔀 Routing to {len(ring.shards)} shard(s) on http://localhost:{args.port}")   # noqa: E501
+    app.run(host="0.0.0.0", port=args.port, threaded=True)
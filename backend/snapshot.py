@@ -0,0 +1,203 @@
+import itertools
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import msgspec
+import numpy as np
+
+# -----------------------------
+# File format
+# -----------------------------
+# MAGIC, a little-endian u64 header length, a JSON header, then each section
+# 8-byte aligned. Profile columns are raw arrays so they can be read straight
+# out of the memory map. Ids and chat memories are runs of msgpack chunks of
+# CHUNK_USERS users each; the header lists every chunk's size.
+MAGIC = b"RBCSNAP2"
+PREFIX = struct.Struct("<8sQ")
+ALIGN = 8
+CHUNK_USERS = 1000
+
+_encode = msgspec.msgpack.Encoder().encode
+# Rows freed by ProfileStore.remove() have no name
+_decode_names = msgspec.msgpack.Decoder(List[Optional[str]]).decode
+_decode_memories = msgspec.msgpack.Decoder(Dict[str, List[Tuple[str, str, str]]]).decode   # noqa: E501
+
+
+def _pad(offset):
+    return -offset % ALIGN
+
+
+def _chunks(items, make):
+    """Encode items CHUNK_USERS at a time, yielding the GIL in between.
+
+    One encode call holds the GIL for as long as it runs, so a single call
+    over every user would stall all request threads for the whole dump.
+    """
+    items = iter(items)
+    chunks = []
+    while True:
+        batch = list(itertools.islice(items, CHUNK_USERS))
+        if not batch:
+            return chunks
+        chunks.append(_encode(make(batch)))
+        time.sleep(0)
+
+
+def write_snapshot(path, memories, profiles):
+    """Write chat memories and the profile store to path atomically.
+
+    `memories` must be a copy of the memory dict; the profile store is
+    copied by its own `export()`.
+    """
+    columns, names = profiles.export()
+    blobs = {
+        "names": _chunks(names, list),
+        "memories": _chunks(memories.items(), dict)
+    }
+
+    sections = {}
+    offset = 0
+    for name, column in columns.items():
+        sections[name] = {"dtype": column.dtype.str, "shape": column.shape,
+                          "offset": offset, "size": column.nbytes}
+        offset += column.nbytes + _pad(column.nbytes)
+    for name, chunks in blobs.items():
+        size = sum(len(chunk) for chunk in chunks)
+        sections[name] = {"offset": offset, "size": size,
+                          "chunks": [len(chunk) for chunk in chunks]}
+        offset += size + _pad(size)
+
+    header = json.dumps({"created": time.time(), "sections": sections}).encode()   # noqa: E501
+    header += b" " * _pad(PREFIX.size + len(header))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(PREFIX.pack(MAGIC, len(header)))
+        f.write(header)
+        for column in columns.values():
+            f.write(column.tobytes())
+            f.write(b"\0" * _pad(column.nbytes))
+        for chunks in blobs.values():
+            for chunk in chunks:
+                f.write(chunk)
+            f.write(b"\0" * _pad(sum(len(chunk) for chunk in chunks)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def load_snapshot(path, profiles):
+    """Load a snapshot into profiles and return the chat memory dict.
+
+    Everything is decoded before profiles is touched, so a damaged file
+    raises without leaving a half-loaded store.
+    """
+    with open(path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            memoryview(mm) as view:
+        magic, header_len = PREFIX.unpack_from(mm)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a snapshot file of this version")   # noqa: E501
+        base = PREFIX.size + header_len
+        sections = json.loads(mm[PREFIX.size:base])["sections"]
+
+        def decode(name, decoder):
+            # Each chunk is decoded straight out of the memory map; its view
+            # is released at once, as the mmap can't close while one is alive
+            start = base + sections[name]["offset"]
+            for size in sections[name]["chunks"]:
+                with view[start:start + size] as chunk:
+                    yield decoder(chunk)
+                start += size
+
+        names = [name for part in decode("names", _decode_names) for name in part]   # noqa: E501
+        memories = {}
+        for part in decode("memories", _decode_memories):
+            memories.update(part)
+        columns = {}
+        for name, section in sections.items():
+            if "dtype" in section:
+                count = int(np.prod(section["shape"]))
+                columns[name] = np.frombuffer(
+                    mm, dtype=section["dtype"], count=count,
+                    offset=base + section["offset"]).reshape(section["shape"])
+        profiles.load(columns, names)
+        del columns
+        return memories
+
+
+# -----------------------------
+# Background snapshots
+# -----------------------------
+class Snapshotter:
+    """Periodically write snapshots from a daemon thread.
+
+    The request path never waits on disk: each round takes a shallow copy
+    of the memory dict (its lists are replaced, never mutated, by
+    `update_memory`) and lets the profile store copy its columns.
+    """
+
+    def __init__(self, path, memories, profiles, interval=60):
+        self.path = path
+        self.memories = memories
+        self.profiles = profiles
+        self.interval = interval
+        self.stats = {"snapshots": 0}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def restore(self):
+        """Load the snapshot at path, if any, into memories and profiles.
+
+        A missing, damaged or older-format file leaves both empty; the
+        error is kept in stats.
+        """
+        if not os.path.exists(self.path):
+            return False
+        start = time.perf_counter()
+        try:
+            memories = load_snapshot(self.path, self.profiles)
+        except Exception as e:
+            # Truncated files, bad magic and missing sections all land here
+            self.stats["restore_error"] = f"{type(e).__name__}: {e}"
+            return False
+        self.memories.update(memories)
+        self.stats["restore_seconds"] = round(time.perf_counter() - start, 3)
+        self.stats["restored_users"] = len(self.profiles)
+        return True
+
+    def snapshot(self):
+        """Write one snapshot now and record its duration and size."""
+        start = time.perf_counter()
+        memories = dict(self.memories)
+        # Let request threads run between this copy and the profile export
+        time.sleep(0)
+        size = write_snapshot(self.path, memories, self.profiles)
+        self.stats["snapshots"] += 1
+        self.stats["last_seconds"] = round(time.perf_counter() - start, 3)
+        self.stats["last_bytes"] = size
+        self.stats["last_at"] = time.time()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.snapshot()
+            except OSError as e:
+                self.stats["last_error"] = str(e)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="snapshotter", daemon=True)   # noqa: E501
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and write a final snapshot."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.snapshot()
@@ -0,0 +1,188 @@
+import contextvars
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+from contextlib import contextmanager
+
+import msgspec
+
+# -----------------------------
+# Request context
+# -----------------------------
+# Set per request by begin() (or per /chat message by request()); read by
+# every log call made from the same thread, including the model call and
+# memory stages.
+# Holds (request_id, route, sampled).
+_context = contextvars.ContextVar("request_context",
+                                  default=(None, None, False))
+
+_encode = msgspec.json.Encoder().encode
+
+
+def parse_sample_rates(spec):
+    """'/health=0,/chat=0.1,*=1' -> {'/health': 0.0, '/chat': 0.1, '*': 1.0}"""
+    rates = {}
+    for item in spec.split(","):
+        if item.strip():
+            route, _, rate = item.partition("=")
+            rates[route.strip()] = float(rate)
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """A JSON object per line: ts, level, event, request_id, route, fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "event": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "route": getattr(record, "route", None),
+            **getattr(record, "fields", {})
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return _encode(entry).decode()
+
+
+class _Record(logging.LogRecord):
+    """A LogRecord with just what JsonFormatter reads.
+
+    The stock constructor also looks up the source file, thread and process
+    names, which is most of the cost of logging on the request thread.
+    """
+
+    def __init__(self, name, level, event, fields):
+        self.name = name
+        self.levelno = level
+        self.levelname = logging.getLevelName(level)
+        self.msg = event
+        self.args = None
+        self.exc_info = None
+        self.exc_text = None
+        self.stack_info = None
+        self.created = time.time()
+        self.fields = fields
+
+
+class _RequestQueueHandler(logging.handlers.QueueHandler):
+    """Stamp the request context on the record, then queue it without blocking."""   # noqa: E501
+
+    def __init__(self, log_queue, stats, max_size):
+        super().__init__(log_queue)
+        self.stats = stats
+        self.max_size = max_size
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread, not here
+        record.request_id, record.route, _ = _context.get()
+        return record
+
+    def enqueue(self, record):
+        # SimpleQueue puts are much cheaper than Queue's, but it has no bound
+        if self.queue.qsize() >= self.max_size:
+            self.stats["dropped"] += 1
+        else:
+            self.queue.put(record)
+
+
+class _PollingQueueListener(logging.handlers.QueueListener):
+    """Drain the queue every `interval` seconds.
+
+    The stock listener blocks in get(), so every record put on an empty
+    queue wakes its thread, which then competes with the request thread.
+    Polling lets records pile up and be handled in one burst.
+    """
+
+    def __init__(self, log_queue, *handlers, interval=0.05):
+        super().__init__(log_queue, *handlers)
+        self.interval = interval
+
+    def dequeue(self, block):
+        while True:
+            try:
+                return self.queue.get_nowait()
+            except queue.Empty:
+                if not block:
+                    raise
+                time.sleep(self.interval)
+
+
+# -----------------------------
+# Structured log
+# -----------------------------
+class StructuredLog:
+    """JSON logs written by a QueueListener thread, sampled per route.
+
+    Request threads only build a LogRecord and put it on a bounded queue;
+    formatting and I/O happen on the listener thread, and records are
+    dropped (and counted) rather than block when the queue is full. Each
+    request is kept or skipped as a whole at its route's sample rate
+    (`'*'` is the default); warnings and errors are always kept.
+    """
+
+    def __init__(self, path="", sample_rates=None, level="INFO", name="emotional_connect", queue_size=10000):   # noqa: E501
+        self.sample_rates = sample_rates if sample_rates is not None else {"*": 1.0}   # noqa: E501
+        self.stats = {"dropped": 0}
+        self._closed = False
+        self.logger = logging.getLogger(name)
+        self.logger.setLevel(level)
+        self.logger.propagate = False
+        self.logger.handlers = [_RequestQueueHandler(queue.SimpleQueue(), self.stats, queue_size)]   # noqa: E501
+        target = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler(sys.stderr)   # noqa: E501
+        target.setFormatter(JsonFormatter())
+        self.listener = _PollingQueueListener(self.logger.handlers[0].queue, target)   # noqa: E501
+        self.listener.start()
+
+    def begin(self, route, request_id=None):
+        """Start a request's context; return its id (new unless given)."""
+        return self._set(route, request_id)[0]
+
+    def _set(self, route, request_id):
+        rate = self.sample_rates.get(route, self.sample_rates.get("*", 1.0))
+        # Only needs to be unique enough to grep for, not unguessable
+        request_id = request_id or f"{random.getrandbits(64):016x}"
+        sampled = rate >= 1 or (rate > 0 and random.random() < rate)
+        return request_id, _context.set((request_id, route, sampled))
+
+    @contextmanager
+    def request(self, route, request_id=None):
+        """Like begin(), but restore the enclosing context on exit."""
+        request_id, token = self._set(route, request_id)
+        try:
+            yield request_id
+        finally:
+            _context.reset(token)
+
+    @property
+    def request_id(self):
+        return _context.get()[0]
+
+    def _log(self, level, event, fields):
+        if self.logger.isEnabledFor(level):
+            # Logger.info() would also walk the stack to find the caller
+            self.logger.handle(_Record(self.logger.name, level, event, fields))
+
+    def info(self, event, **fields):
+        """Log an event for the current request if it was sampled."""
+        if _context.get()[2]:
+            self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def close(self):
+        """Write out everything queued and stop the listener thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
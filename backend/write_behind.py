@@ -0,0 +1,159 @@
+import sqlite3
+import threading
+import time
+
+import msgspec
+
+# -----------------------------
+# Durable per-user store
+# -----------------------------
+_encode = msgspec.msgpack.Encoder().encode
+_decode = msgspec.msgpack.Decoder().decode
+
+
+class UserStore:
+    """Chat memory and profile per user in SQLite, as msgpack blobs."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._db().execute(
+            "CREATE TABLE IF NOT EXISTS users "
+            "(user_id TEXT PRIMARY KEY, memory BLOB, profile BLOB) WITHOUT ROWID")   # noqa: E501
+
+    def _db(self):
+        """One connection per thread, in autocommit mode."""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def write_many(self, rows):
+        """Upsert (user_id, memory, profile) rows in one transaction.
+
+        A row whose memory and profile are both None is deleted.
+        """
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            for user_id, memory, profile in rows:
+                if memory is None and profile is None:
+                    db.execute("DELETE FROM users WHERE user_id = ?", (user_id,))   # noqa: E501
+                else:
+                    db.execute("INSERT OR REPLACE INTO users VALUES (?, ?, ?)",
+                               (user_id, _encode(memory), _encode(profile)))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def load(self, user_id):
+        """Return (memory, profile) for a user, or None if not stored."""
+        row = self._db().execute(
+            "SELECT memory, profile FROM users WHERE user_id = ?", (user_id,)).fetchone()   # noqa: E501
+        if row is None:
+            return None
+        memory = _decode(row[0])
+        return [tuple(entry) for entry in memory] if memory else memory, _decode(row[1])   # noqa: E501
+
+
+# -----------------------------
+# Write-behind pipeline
+# -----------------------------
+class WriteBehind:
+    """Flush dirty keys to storage from a background thread.
+
+    Requests update the in-memory view and `mark()` the key; they never
+    wait on storage unless more than `max_pending` keys are waiting
+    (backpressure). The worker flushes whenever `batch_size` keys are dirty
+    and at least every `max_lag` seconds. `flush(keys)` reads the current
+    view, so repeated writes to a key between flushes are coalesced.
+    """
+
+    def __init__(self, flush, max_lag=1.0, batch_size=500, max_pending=10000):   # noqa: E501
+        self.flush = flush
+        self.max_lag = max_lag
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.stats = {"flushes": 0, "flushed_keys": 0, "errors": 0, "max_lag": 0.0}   # noqa: E501
+        self._dirty = set()
+        self._flushing = set()
+        self._oldest = None
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)   # noqa: E501
+        self._thread.start()
+
+    def mark(self, key):
+        """Record that key changed in the view."""
+        with self._cond:
+            while len(self._dirty) >= self.max_pending and not self._closed:
+                self._cond.wait()
+            if not self._dirty:
+                self._oldest = time.monotonic()
+            self._dirty.add(key)
+            if len(self._dirty) >= self.batch_size:
+                self._cond.notify_all()
+
+    def pending(self, key):
+        """True while key has changes that storage hasn't seen yet."""
+        with self._cond:
+            return key in self._dirty or key in self._flushing
+
+    def forget(self, keys):
+        """Stop tracking keys; return those with changes not yet flushed.
+
+        Waits for an in-progress flush of any of them, so the caller can
+        write the returned keys itself and then drop them from the view.
+        """
+        keys = set(keys)
+        with self._cond:
+            self._cond.wait_for(lambda: not keys & self._flushing)
+            forgotten = keys & self._dirty
+            self._dirty -= forgotten
+            if not self._dirty:
+                self._oldest = None
+            self._cond.notify_all()
+            return forgotten
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._dirty) >= self.batch_size or self._closed,   # noqa: E501
+                                    timeout=self.max_lag)
+                keys, self._dirty = self._dirty, set()
+                self._flushing = keys
+                oldest, self._oldest = self._oldest, None
+                closed = self._closed
+                self._cond.notify_all()
+
+            if keys:
+                try:
+                    self.flush(keys)
+                    self.stats["flushes"] += 1
+                    self.stats["flushed_keys"] += len(keys)
+                    lag = time.monotonic() - oldest
+                    self.stats["max_lag"] = round(max(self.stats["max_lag"], lag), 3)   # noqa: E501
+                except Exception:
+                    # Keep the keys dirty and retry on the next round
+                    self.stats["errors"] += 1
+                    with self._cond:
+                        self._dirty |= keys
+                        self._oldest = oldest
+                    if closed:
+                        return
+
+            with self._cond:
+                self._flushing = set()
+                self._cond.notify_all()
+                if closed and not self._dirty:
+                    return
+
+    def close(self, timeout=30):
+        """Flush everything still dirty and stop the worker."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
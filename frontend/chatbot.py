@@ -1,8 +1,9 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import requests
-from datetime import datetime
-import time
+import os
 import random
+import secrets
 import json  # noqa F401
 
 # -----------------------------
@@ -16,6 +17,16 @@ st.set_page_config(
 )
 
 DIV_END = '</div>'
+BACKEND_URL = "http://127.0.0.1:9000"
+BACKEND_WS_URL = "ws://127.0.0.1:9000/chat"
+# Only the latest messages live in the session; older ones are paged in
+# from the backend's /history
+MAX_SESSION_MESSAGES = 20
+
+chat_socket = components.declare_component(
+    "chat_socket",
+    path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "chat_socket")    # noqa: E501
+)
 
 
 # -----------------------------
@@ -40,99 +51,6 @@ st.markdown("""
         box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
     }
 
-    /* Chat container */
-    .chat-container {
-        height: 500px;
-        overflow-y: auto;
-        padding: 1rem;
-        background: linear-gradient(to bottom, #f0f2f5, #ffffff);
-        border-radius: 15px;
-        margin-bottom: 1rem;
-        border: 1px solid #e0e0e0;
-    }
-
-    /* Message bubbles */
-    .user-message {
-        background: linear-gradient(135deg, #25D366, #128C7E);
-        color: white;
-        padding: 12px 16px;
-        border-radius: 18px 18px 5px 18px;
-        margin: 8px 0;
-        margin-left: 20%;
-        max-width: 75%;
-        word-wrap: break-word;
-        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
-        animation: slideInRight 0.3s ease-out;
-    }
-
-    .ai-message {
-        background: linear-gradient(135deg, #ffffff, #f8f9fa);
-        color: #333;
-        padding: 12px 16px;
-        border-radius: 18px 18px 18px 5px;
-        margin: 8px 0;
-        margin-right: 20%;
-        max-width: 75%;
-        word-wrap: break-word;
-        border: 1px solid #e1e5e9;
-        box-shadow: 0 2px 4px rgba(0, 0, 0, 0.1);
-        animation: slideInLeft 0.3s ease-out;
-    }
-
-    /* Animations */
-    @keyframes slideInRight {
-        from { transform: translateX(100%); opacity: 0; }
-        to { transform: translateX(0); opacity: 1; }
-    }
-
-    @keyframes slideInLeft {
-        from { transform: translateX(-100%); opacity: 0; }
-        to { transform: translateX(0); opacity: 1; }
-    }
-
-    /* Message timestamp */
-    .timestamp {
-        font-size: 0.75rem;
-        color: rgba(255, 255, 255, 0.7);
-        margin-top: 4px;
-        text-align: right;
-    }
-
-    .timestamp-ai {
-        font-size: 0.75rem;
-        color: #666;
-        margin-top: 4px;
-        text-align: left;
-    }
-
-    /* Typing indicator */
-    .typing-indicator {
-        background: #f0f0f0;
-        color: #666;
-        padding: 8px 16px;
-        border-radius: 18px;
-        margin: 8px 0;
-        margin-right: 20%;
-        max-width: 60%;
-        animation: pulse 1.5s infinite;
-    }
-
-    @keyframes pulse {
-        0% { opacity: 0.6; }
-        50% { opacity: 1; }
-        100% { opacity: 0.6; }
-    }
-
-    /* Input area */
-    .input-container {
-        background: white;
-        padding: 1rem;
-        border-radius: 25px;
-        border: 2px solid #e0e0e0;
-        margin-bottom: 1rem;
-        box-shadow: 0 2px 8px rgba(0, 0, 0, 0.1);
-    }
-
     /* Sidebar styling */
     .sidebar-content {
         background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
@@ -177,6 +95,22 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# -----------------------------
+# Backend health
+# -----------------------------
+@st.cache_data(ttl=15, show_spinner=False)
+def backend_health():
+    """Probe the backend at most every 15s instead of on every rerun.
+
+    Returns the health payload, {} on an error status, or None if offline.
+    """
+    try:
+        health_response = requests.get(f"{BACKEND_URL}/health", timeout=3)   # noqa: E501
+    except requests.exceptions.RequestException:
+        return None
+    return health_response.json() if health_response.status_code == 200 else {}   # noqa: E501
+
+
 # -----------------------------
 # Initialize Session State
 # -----------------------------
@@ -185,10 +119,20 @@ def initialize_session_state():
         st.session_state.messages = []
     if "user_id" not in st.session_state:
         st.session_state.user_id = f"user_{random.randint(1000, 9999)}"
+    if "history_token" not in st.session_state:
+        # Only this session can read back its history: the backend needs
+        # the token as well as the guessable user_id
+        st.session_state.history_token = secrets.token_urlsafe(24)
     if "conversation_started" not in st.session_state:
         st.session_state.conversation_started = False
     if "ai_personality" not in st.session_state:
         st.session_state.ai_personality = {}
+    if "chat_epoch" not in st.session_state:
+        st.session_state.chat_epoch = 0
+    if "last_exchange" not in st.session_state:
+        st.session_state.last_exchange = None
+    if "message_counts" not in st.session_state:
+        st.session_state.message_counts = {"You": 0, "AI": 0}
 
 
 initialize_session_state()
@@ -242,7 +186,8 @@ with st.sidebar:
         help="Primary language for conversation"
     )
 
-    region = st.text_input("📍 Your Region", "Maharashtra", help="Your location for cultural context")    # noqa: E501
+    # The backend rejects regions longer than 64 characters
+    region = st.text_input("📍 Your Region", "Maharashtra", max_chars=64, help="Your location for cultural context")    # noqa: E501
 
     st.markdown("### 🎨 Chat Customization")
 
@@ -267,26 +212,35 @@ with st.sidebar:
     if st.button("🗑️ Clear Chat", type="secondary"):
         # Reset conversation with API
         try:
-            requests.post("http://127.0.0.1:9000/reset_memory",
-                          json={"user_id": st.session_state.user_id})
+            requests.post(f"{BACKEND_URL}/reset_memory",
+                          json={"user_id": st.session_state.user_id,
+                                "history_token": st.session_state.history_token})   # noqa: E501
         except requests.exceptions.RequestException:
             pass
 
         st.session_state.messages = []
+        st.session_state.message_counts = {"You": 0, "AI": 0}
         st.session_state.conversation_started = False
+        # A new key remounts the chat component with an empty history
+        st.session_state.chat_epoch += 1
         st.rerun()
 
-    # Export chat
+    # Export chat: the backend streams the whole history straight to the
+    # browser, so it never has to fit in this session. The download link
+    # carries a one-time ticket rather than the history token.
     if st.button("📄 Export Chat"):
-        if st.session_state.messages:
-            chat_text = "\n".join([f"{msg['sender']} ({msg['time']}): {msg['text']}"     # noqa: E501
-                                  for msg in st.session_state.messages])
-        st.download_button(
-            "Download Chat History",
-            chat_text,
-            file_name=f"chat_history_{datetime.now().strftime('%Y%m%d_%H%M')}.txt",    # noqa: E501
-            mime="text/plain"
-        )
+        try:
+            ticket = requests.post(f"{BACKEND_URL}/history/export",
+                                   params={"user_id": st.session_state.user_id},   # noqa: E501
+                                   headers={"X-History-Token": st.session_state.history_token},   # noqa: E501
+                                   timeout=5)
+            if ticket.status_code == 200:
+                st.link_button("⬇️ Download (link works once, for a minute)",
+                               f"{BACKEND_URL}{ticket.json()['url']}")
+            else:
+                st.error("Export is not available")
+        except requests.exceptions.RequestException:
+            st.error("Backend is offline")
 
 # -----------------------------
 # Main Chat Interface
@@ -294,163 +248,45 @@ with st.sidebar:
 col1, col2 = st.columns([3, 1])
 
 with col1:
-    # Chat display area
-    chat_container = st.container()
-
-    with chat_container:
-        st.markdown('<div class="chat-container">', unsafe_allow_html=True)
-
-        # Display welcome message for new conversations
-        if not st.session_state.conversation_started and not st.session_state.messages:    # noqa: E501
-            st.markdown(f"""
-            <div class="ai-message">
-                <strong>Welcome! 👋</strong><br>
-                I'm your {relationship_type} AI companion with a {ai_behavior} personality.<br>
-                I'm here to chat, support, and understand you. What's on your mind?
-                <div class="timestamp-ai">{datetime.now().strftime("%H:%M")}</div>
-            </div>
-            """, unsafe_allow_html=True)
-
-        # Display chat messages
-        for msg in st.session_state.messages[-20:]:  # Show last 20 messages
-            if msg["sender"] == "You":
-                st.markdown(f"""
-                <div class="user-message">
-                    {msg["text"]}
-                    <div class="timestamp">{msg["time"]}</div>
-                </div>
-                """, unsafe_allow_html=True)
-            else:
-                st.markdown(f"""
-                <div class="ai-message">
-                    {msg["text"]}
-                    <div class="timestamp-ai">{msg["time"]}</div>
-                </div>
-                """, unsafe_allow_html=True)
-
-        st.markdown(DIV_END, unsafe_allow_html=True)
-
-# Input area
-st.markdown('<div class="input-container">', unsafe_allow_html=True)
-
-# Create input form
-with st.form("chat_form", clear_on_submit=True):
-    input_col1, input_col2 = st.columns([4, 1])
-
-    with input_col1:
-        user_input = st.text_input(
-            "Type your message...",
-            placeholder=f"Chat with your {ai_behavior} {relationship_type}...",
-            label_visibility="collapsed"
-        )
-
-        # Add selected emoji to input
-        if selected_emoji:
-            user_input += f" {selected_emoji}"
-
-    with input_col2:
-        send_button = st.form_submit_button("Send 📤", type="primary")
-
-st.markdown(DIV_END, unsafe_allow_html=True)
+    # Chat display and input live in one component that keeps a WebSocket
+    # open to the backend. Replies stream in without a blocking request;
+    # only the finished exchange reruns this script to update the stats.
+    exchange = chat_socket(
+        url=BACKEND_WS_URL,
+        history_url=f"{BACKEND_URL}/history",
+        history=st.session_state.messages,
+        welcome=(f"Welcome! 👋\nI'm your {relationship_type} AI companion with a {ai_behavior} personality.\n"    # noqa: E501
+                 "I'm here to chat, support, and understand you. What's on your mind?"),    # noqa: E501
+        placeholder=f"Chat with your {ai_behavior} {relationship_type}...",
+        emoji=selected_emoji,
+        settings={
+            "relationship_type": relationship_type,
+            "tier": tier,
+            "user_id": st.session_state.user_id,
+            "history_token": st.session_state.history_token,
+            "region": region,
+            "tz": "Asia/Kolkata",
+            "user_gender": user_gender,
+            "ai_gender": ai_gender,
+            "language": language,
+            "ai_behavior": ai_behavior
+        },
+        key=f"chat_socket_{st.session_state.chat_epoch}",
+        default=None
+    )
 
 # -----------------------------
 # Message Processing
 # -----------------------------
-if send_button and user_input.strip():
-    # Add user message
-    timestamp = datetime.now().strftime("%H:%M")
-    st.session_state.messages.append({
-        "sender": "You",
-        "text": user_input,
-        "time": timestamp
-    })
-
+# The component reports each finished exchange once; keep the latest few
+# for a remount and count them for the stats
+if exchange and exchange["seq"] != st.session_state.last_exchange:
+    st.session_state.last_exchange = exchange["seq"]
+    st.session_state.messages = (st.session_state.messages + exchange["messages"])[-MAX_SESSION_MESSAGES:]    # noqa: E501
+    for msg in exchange["messages"]:
+        st.session_state.message_counts[msg["sender"]] += 1
     st.session_state.conversation_started = True
 
-    # Show typing indicator
-    typing_placeholder = st.empty()
-
-    with typing_placeholder.container():
-        st.markdown("""
-        <div class="typing-indicator">
-            <strong>AI is typing</strong>
-            <span style="animation: blink 1s infinite;">●●●</span>
-        </div>
-        """, unsafe_allow_html=True)
-
-    # Prepare API payload
-    payload = {
-        "user_input": user_input,
-        "relationship_type": relationship_type,
-        "tier": tier,
-        "user_id": st.session_state.user_id,
-        "region": region,
-        "tz": "Asia/Kolkata",
-        "user_gender": user_gender,
-        "ai_gender": ai_gender,
-        "language": language,
-        "ai_behavior": ai_behavior
-    }
-
-    try:
-        # Call backend API
-        response = requests.post("http://127.0.0.1:9000/process", json=payload, timeout=10)    # noqa: E501
-
-        if response.status_code == 200:
-            data = response.json()
-            reply = data["reply"]
-
-            # Simulate realistic typing delay
-            typing_delay = data.get("typing_delay", 2.0)
-            time.sleep(min(typing_delay, 4.0))  # Cap at 4 seconds
-
-            # Clear typing indicator
-            typing_placeholder.empty()
-
-            # Add AI response
-            timestamp = datetime.now().strftime("%H:%M")
-            st.session_state.messages.append({
-                "sender": "AI",
-                "text": reply,
-                "time": timestamp
-            })
-
-        else:
-            typing_placeholder.empty()
-            error_msg = response.json().get('error', 'Unknown error occurred')
-            st.session_state.messages.append({
-                "sender": "AI",
-                "text": f"Sorry, I'm having technical difficulties: {error_msg}",  # noqa: E501
-                "time": datetime.now().strftime("%H:%M")
-            })
-
-    except requests.exceptions.Timeout:
-        typing_placeholder.empty()
-        st.session_state.messages.append({
-            "sender": "AI",
-            "text": "Sorry, I'm taking too long to respond. Please try again.",
-            "time": datetime.now().strftime("%H:%M")
-        })
-
-    except requests.exceptions.ConnectionError:
-        typing_placeholder.empty()
-        st.session_state.messages.append({
-            "sender": "AI",
-            "text": "🔌 Connection error! Make sure the backend server is running on port 9000.",   # noqa: E501
-            "time": datetime.now().strftime("%H:%M")
-        })
-
-    except Exception as e:
-        typing_placeholder.empty()
-        st.session_state.messages.append({
-            "sender": "AI",
-            "text": f"Unexpected error: {str(e)}",
-            "time": datetime.now().strftime("%H:%M")
-        })
-
-    # Refresh the page to show new messages
-    st.rerun()
-
 # -----------------------------
 # Statistics Sidebar
 # -----------------------------
@@ -458,9 +294,9 @@ with col2:
     st.markdown("### 📊 Chat Stats")
 
     # Conversation statistics
-    total_messages = len(st.session_state.messages)
-    user_messages = len([m for m in st.session_state.messages if m["sender"] == "You"])    # noqa: E501
-    ai_messages = len([m for m in st.session_state.messages if m["sender"] == "AI"])    # noqa: E501
+    user_messages = st.session_state.message_counts["You"]
+    ai_messages = st.session_state.message_counts["AI"]
+    total_messages = user_messages + ai_messages
 
     st.metric("Total Messages", total_messages)
     st.metric("Your Messages", user_messages)
@@ -477,17 +313,15 @@ with col2:
 
     # Connection status
     st.markdown("### 🔗 Status")
-    try:
-        health_response = requests.get("http://127.0.0.1:9000/health", timeout=3)   # noqa: E501
-        if health_response.status_code == 200:
-            st.success("✅ Backend Connected")
-            health_data = health_response.json()
-            st.caption(f"Active users: {health_data.get('active_users', 0)}")
-        else:
-            st.error("❌ Backend Error")
-    except requests.exceptions.RequestException:
+    health_data = backend_health()
+    if health_data is None:
         st.error("❌ Backend Offline")
         st.caption("Start the backend with: `python app.py`")
+    elif health_data:
+        st.success("✅ Backend Connected")
+        st.caption(f"Active users: {health_data.get('active_users', 0)}")
+    else:
+        st.error("❌ Backend Error")
 
 # -----------------------------
 # Footer
@@ -498,17 +332,8 @@ st.markdown("""
     <small>
         💡 <strong>Tips:</strong> Be specific about your needs • Use natural language   # noqa: E501
         The AI learns from your conversation style<br>
-        🔒 Your conversations are private and stored temporarily for context
+        🔒 Your messages are saved on the server so you can page back and
+        export them; Clear Chat deletes them
     </small>
 </div>
 """, unsafe_allow_html=True)
-
-# Auto-scroll to bottom (JavaScript injection)
-st.markdown("""
-<script>
-    var chatContainer = document.querySelector('.chat-container');
-    if (chatContainer) {
-        chatContainer.scrollTop = chatContainer.scrollHeight;
-    }
-</script>
-""", unsafe_allow_html=True)